@@ -4,78 +4,249 @@ MIT License
 Copyright (c) 2025 Fortinet Inc
 Copyright end
 """
+import copy
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from typing_extensions import override
-from openai import AssistantEventHandler
+from openai import AssistantEventHandler, BadRequestError
 from openai.types.beta.threads.runs import RunStepDelta
 from openai.types.beta.threads import Message, MessageDelta
 from openai.types.beta.threads.runs import ToolCall, RunStep
 from openai.types.beta import AssistantStreamEvent
 from .operations import *
-from .utils import execute_connector_action
+from .utils import execute_connector_action, close_thread_db_connections
 
 logger = get_logger(LOGGER_NAME)
 
 
+def merge_token_usage(token_usage, other):
+    ''' adds the counts of other into token_usage, nested details included '''
+    for key, value in other.items():
+        if isinstance(value, dict):
+            merge_token_usage(token_usage.setdefault(key, {}), value)
+        elif isinstance(value, int):
+            token_usage[key] = (token_usage.get(key) or 0) + value
+
+
+def get_run_token_usage(run_usage, tool_usages):
+    ''' the usage of the run plus the tokens used by its tool functions '''
+    tool_usages = [tool_usage for tool_usage in tool_usages if tool_usage]
+    if not tool_usages:
+        return run_usage
+    token_usage = copy.deepcopy(run_usage) or {}
+    for tool_usage in tool_usages:
+        merge_token_usage(token_usage, tool_usage)
+    return token_usage
+
+
+class ToolCallResult:
+    ''' outcome of one tool call of a requires_action event '''
+
+    def __init__(self, tool, output=None, status='Failed', to_add_message=True, token_usage=None, latency=0.0):
+        self.tool_call_id = tool.id
+        self.function_name = tool.function.name
+        self.output = output
+        self.status = status
+        self.to_add_message = to_add_message
+        self.token_usage = token_usage
+        self.latency = round(latency, 3)
+
+    def summary(self):
+        return {'tool_call_id': self.tool_call_id, 'function_name': self.function_name, 'status': self.status,
+                'to_add_message': self.to_add_message, 'latency': self.latency}
+
+
+class RunAccumulator:
+    ''' state of one assistant run, shared by the event handler of the run and the handlers of the tool output
+    streams nested in it, so that the run is finalized once with the data of every tool round '''
+
+    def __init__(self):
+        self.run_id = None
+        self.run_object = None
+        self.tool_calls = []
+        self.messages = []
+        self.cancelled = False
+        self.stream_error = False
+
+    def is_streamed_to_completion(self):
+        ''' the streams delivered every message of the run and its final state, nothing has to be fetched again;
+        messages added directly to the thread when the run is cancelled are not streamed '''
+        return bool(self.run_object) and self.run_object['status'] == 'completed' and not self.cancelled and \
+            not self.stream_error
+
+    def get_thread_messages(self):
+        # same page as listing the messages after the question, newest first
+        data = list(reversed(self.messages))
+        return {'data': data, 'object': 'list', 'first_id': data[0]['id'] if data else None,
+                'last_id': data[-1]['id'] if data else None, 'has_more': False}
+
+    def get_token_usage(self):
+        return get_run_token_usage((self.run_object or {}).get('usage'),
+                                   [result.token_usage for result in self.tool_calls])
+
+
+class ToolCallRunner:
+    ''' runs the tool functions requested by an assistant run through the configured connector action '''
+
+    def __init__(self, config, params):
+        self.config = config
+        self.params = params
+
+    def get_tool_outputs(self, run_id, results, cancelled=False):
+        ''' returns the tool outputs to submit and whether the run was cancelled; an output that must not go back
+        to the run is added to the thread as the assistant's answer and the run is cancelled '''
+        tool_outputs = []
+        for result in results:
+            # To add tool call function output to thread or not
+            if result.to_add_message:
+                tool_outputs.append({"tool_call_id": result.tool_call_id, "output": result.output})
+                continue
+            # Directly add the message to thread and cancel the run
+            if not cancelled:
+                cancel_run(config=self.config, params={'thread_id': self.params['thread_id'], 'run_id': run_id})
+                cancelled = True
+            create_thread_message(self.config,
+                                  params={'thread_id': self.params['thread_id'], 'role': 'assistant',
+                                          'content': result.output})
+        return tool_outputs, cancelled
+
+    def run_tool_calls(self, tools):
+        ''' runs the tool calls of one requires_action event concurrently, each bounded by the tool call timeout, and
+        returns their results in tool call order '''
+        if not tools:
+            return []
+        max_workers = int(self.params.get('tool_call_max_workers') or TOOL_CALL_MAX_WORKERS)
+        timeout = float(self.params.get('tool_call_timeout') or TOOL_CALL_TIMEOUT)
+        started = {}
+
+        def run(index, tool):
+            started[index] = time.monotonic()
+            return self.tool_call_type_function(tool)
+
+        executor = ThreadPoolExecutor(max_workers=min(max_workers, len(tools)), thread_name_prefix='openai-tool-call')
+        futures = {executor.submit(run, index, tool): index for index, tool in enumerate(tools)}
+        results = [None] * len(tools)
+        pending = set(futures)
+        try:
+            while pending:
+                # a call's timeout starts when a worker picks it up, not while it waits for a free worker
+                deadlines = [started[futures[future]] + timeout for future in pending if futures[future] in started]
+                wait_time = max(0.0, min(deadlines) - time.monotonic()) if deadlines else TOOL_CALL_POLL_INTERVAL
+                done, pending = wait(pending, timeout=wait_time, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[futures[future]] = future.result()
+                now = time.monotonic()
+                for future in [future for future in pending if now - started.get(futures[future], now) >= timeout]:
+                    pending.discard(future)
+                    tool = tools[futures[future]]
+                    logger.error(f'Tool function {tool.function.name} timed out after {timeout} seconds')
+                    results[futures[future]] = ToolCallResult(
+                        tool, f'Tool function call timed out after {timeout} seconds.', 'Timeout', latency=timeout)
+        finally:
+            # a timed out call cannot be interrupted, it finishes in the background and its result is discarded
+            executor.shutdown(wait=False, cancel_futures=True)
+        return results
+
+    def tool_call_type_function(self, tool):
+        logger.info(
+            f'Calling tool function, Function Name: {tool.function.name}, Function Argument: {tool.function.arguments}')
+        start = time.perf_counter()
+        # call required function
+        result = self.call_required_function(tool.function.name, tool.function.arguments)
+        logger.info(f'Function Calling output: {result["output"]}')
+        if not result['output']:
+            result['output'] = 'There seems to be some issue while function calling output is None.'
+        return ToolCallResult(tool, latency=time.perf_counter() - start, **result)
+
+    def call_required_function(self, function_name, arguments):
+        result = {'output': None, 'status': 'Failed', 'to_add_message': True, 'token_usage': None}
+        try:
+            payload = {"connector_name": 'openai', "config_id": self.config['config_id'],
+                       "function_name": function_name, "arguments": arguments, "tool_call_metadata": self.params}
+            response = execute_connector_action(self.params['tool_call_function_config_id'],
+                                                self.params['tool_call_function_connector_name'],
+                                                self.params['tool_call_function_operation_name'], payload)
+            if response.get('status') == 'Success':
+                result.update({'output': response['data'].get('function_calling_output'), 'status': 'Success'})
+                if 'to_add_message' in response['data']:
+                    result['to_add_message'] = response['data'].get('to_add_message')
+                if 'token_usage' in response['data']:
+                    result['token_usage'] = response['data'].get('token_usage')
+                return result
+            result['output'] = response.get('message')
+            if not result['output']:
+                result['output'] = 'Unknown error occurred.'
+        except Exception as error:
+            error_message = f'Error occurred while executing tool function call: {error}'
+            logger.error(error_message)
+            result['output'] = error_message
+        finally:
+            close_thread_db_connections()
+        return result
+
+
 class EventHandler(AssistantEventHandler):
-    def __init__(self, config, params, last_message_id):
+    def __init__(self, config, params, last_message_id, accumulator=None):
         super().__init__()
         self.run_id = None
         self.thread_messages = []
         self.config = config
         self.params = params
-        self.tool_outputs = []
         self.token_usage = {}
-        self.function_call_token_usage = None
         self.last_message_id = last_message_id
-        self.to_add_message = True
-        self.function_calling_output = None
+        # the handler of the run owns the accumulator, the handlers of nested tool output streams only add to it
+        self.is_root = accumulator is None
+        self.accumulator = accumulator or RunAccumulator()
+        self.tool_runner = ToolCallRunner(config, params)
+        self.run_wait = {'polls': 0, 'wait_time': 0}
+
+    @property
+    def tool_calls(self):
+        return [result.summary() for result in self.accumulator.tool_calls]
 
     # Executes on every event
     @override
     def on_event(self, event: AssistantStreamEvent) -> None:
         # logger.info(f'event: {event.event}')
-        self.run_id = event.data.id
+        if not event.event.startswith('thread.run.') or event.event.startswith('thread.run.step.'):
+            return
+        self.run_id = self.accumulator.run_id = event.data.id
         if event.event == 'thread.run.requires_action':
             self.handle_requires_action(data=event.data)
+        elif event.data.status in RUN_TERMINAL_STATUSES:
+            # the stream delivered the final state of the run, no need to poll for it
+            self.accumulator.run_object = event.data.model_dump()
 
     def handle_requires_action(self, data):
-        for tool in data.required_action.submit_tool_outputs.tool_calls:
-            if tool.type == 'function':
-                self.tool_call_type_function(tool=tool)
+        tools = [tool for tool in data.required_action.submit_tool_outputs.tool_calls if tool.type == 'function']
+        results = self.tool_runner.run_tool_calls(tools)
+        self.accumulator.tool_calls.extend(results)
+        tool_outputs, self.accumulator.cancelled = self.tool_runner.get_tool_outputs(self.run_id, results,
+                                                                                     self.accumulator.cancelled)
         # Submit all tool_outputs at the same time
-        self.submit_tool_outputs()
+        self.submit_tool_outputs(tool_outputs)
 
-    def tool_call_type_function(self, tool):
-        logger.info(
-            f'Calling tool function, Function Name: {tool.function.name}, Function Argument: {tool.function.arguments}')
-        # call required function
-        self.call_required_function(tool.function.name, tool.function.arguments)
-        logger.info(f'Function Calling output: {self.function_calling_output}')
-        if not self.function_calling_output:
-            self.function_calling_output = 'There seems to be some issue while function calling output is None.'
-        # To add tool call function output to thread or not
-        if self.to_add_message:
-            self.tool_outputs.append({"tool_call_id": tool.id, "output": self.function_calling_output})
-        else:
-            # Directly add the message to thread and cancel the run
-            cancel_run(config=self.config,
-                       params={'thread_id': self.params['thread_id'], 'run_id': self.run_id})
-            create_thread_message(self.config,
-                                  params={'thread_id': self.params['thread_id'], 'role': 'assistant',
-                                          'content': self.function_calling_output})
-
-    def submit_tool_outputs(self):
-        client = openai.OpenAI(api_key=self.config['apiKey'], project=self.config.get('project'),
-                               organization=self.config.get('organization'))
-        run_object = get_run(config=self.config, params={'run_id': self.run_id, 'thread_id': self.params['thread_id']})
-        if run_object['status'] != 'cancelled':
+    def submit_tool_outputs(self, tool_outputs):
+        if self.accumulator.cancelled:
+            return
+        client = get_client(self.config)
+        try:
             with client.beta.threads.runs.submit_tool_outputs_stream(
                     thread_id=self.params['thread_id'],
                     run_id=self.run_id,
-                    tool_outputs=self.tool_outputs,
-                    event_handler=EventHandler(self.config, self.params, self.last_message_id)
+                    tool_outputs=tool_outputs,
+                    event_handler=EventHandler(self.config, self.params, self.last_message_id, self.accumulator)
             ) as stream:
                 stream.until_done()
+        except BadRequestError:
+            # the run no longer waits for the outputs, e.g. it was cancelled or expired meanwhile
+            run_object = get_run(config=self.config, params={'run_id': self.run_id,
+                                                             'thread_id': self.params['thread_id']})
+            if run_object['status'] not in RUN_TERMINAL_STATUSES:
+                raise
+            logger.warning(f'Tool output not submitted, run {self.run_id} is {run_object["status"]}')
+            self.accumulator.run_object = run_object
+            return
         logger.info(f'Successfully submitted tool output')
 
     # thread.run.step.created
@@ -106,7 +277,7 @@ class EventHandler(AssistantEventHandler):
     # thread.message.completed
     @override
     def on_message_done(self, message: Message) -> None:
-        pass
+        self.accumulator.messages.append(message.model_dump())
 
     @override
     def on_tool_call_created(self, tool_call):
@@ -123,67 +294,32 @@ class EventHandler(AssistantEventHandler):
 
     @override
     def on_end(self):
-        run_payload = {'run_id': self.run_id, 'thread_id': self.params['thread_id']}
-        run_object = get_run(config=self.config, params=run_payload)
-
-        # wait for the run to get completed or canceled to load the messages
-        while run_object['status'] not in ['completed', 'cancelled']:
-            run_object = get_run(config=self.config, params=run_payload)
-            # logger.info(f'Run Status: {run_object.status}')
+        # a nested tool output stream ends inside the stream of the run, the run is finalized once when it ends
+        if not self.is_root:
+            return
+        if self.accumulator.is_streamed_to_completion():
+            self.thread_messages = self.accumulator.get_thread_messages()
+            self.token_usage = self.accumulator.get_token_usage()
+            return
+        # the stream ended before the run completed, fall back to fetching the run state and its messages
+        run_payload = {'run_id': self.run_id, 'thread_id': self.params['thread_id'],
+                       'wait_timeout': self.params.get('wait_timeout')}
+        # wait for the run to reach a terminal status to load the messages
+        run_object, self.run_wait = wait_for_run(self.config, run_payload, self.accumulator.run_object)
+        self.accumulator.run_object = run_object
+        if run_object['status'] != 'completed':
+            logger.warning(f'Run {self.run_id} ended with status {run_object["status"]}: {run_object.get("last_error")}')
 
         self.thread_messages = list_thread_messages(config=self.config,
                                                     params={'thread_id': self.params['thread_id'],
                                                             'before': self.last_message_id})
-        # check if more token has been used in function calling
-        if self.function_call_token_usage is not None:
-            self.token_usage = self.set_token_usage(run_object['usage'])
-        else:
-            self.token_usage = run_object['usage']
+        # the run usage plus the tokens used by the tool functions of every tool round
+        self.token_usage = self.accumulator.get_token_usage()
 
     @override
     def on_exception(self, exception: Exception) -> None:
+        self.accumulator.stream_error = True
         logger.error(f"Exception occurred while executing thread: {exception}")
 
     def get_thread_messages(self):
         return self.thread_messages
-
-    def call_required_function(self, function_name, arguments):
-        try:
-            payload = {"connector_name": 'openai', "config_id": self.config['config_id'],
-                       "function_name": function_name, "arguments": arguments, "tool_call_metadata": self.params}
-            response = execute_connector_action(self.params['tool_call_function_config_id'],
-                                                self.params['tool_call_function_connector_name'],
-                                                self.params['tool_call_function_operation_name'], payload)
-            if response.get('status') == 'Success':
-                self.function_calling_output = response['data'].get('function_calling_output')
-                if 'to_add_message' in response['data']:
-                    self.to_add_message = response['data'].get('to_add_message')
-                if 'token_usage' in response['data']:
-                    self.function_call_token_usage = response['data'].get('token_usage')
-                return
-            self.function_calling_output = response.get('message')
-            if not self.function_calling_output:
-                self.function_calling_output = 'Unknown error occurred.'
-        except Exception as error:
-            error_message = f'Error occurred while executing tool function call: {error}'
-            logger.error(error_message)
-            self.function_calling_output = error_message
-
-    # Add function call token to run call token usage
-    def set_token_usage(self, token_usage):
-        self.function_call_token_usage = dict(self.function_call_token_usage)
-        token_usage = dict(token_usage)
-
-        self.merge_dicts(token_usage, self.function_call_token_usage)
-        return token_usage
-
-    def merge_dicts(self, dict1, dict2):
-        for key, value in dict2.items():
-            if isinstance(value, dict):
-                # Check if value is dict, and present in dict
-                if key not in dict1:
-                    # Create a new dict if not present
-                    dict1[key] = {}
-                self.merge_dicts(dict1[key], value)
-            elif isinstance(value, int):
-                dict1[key] = dict1.get(key, 0) + value
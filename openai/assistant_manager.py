@@ -4,13 +4,43 @@ MIT License
 Copyright (c) 2025 Fortinet Inc
 Copyright end
 """
+import threading
+from collections import OrderedDict
+from openai import BadRequestError
 
-from .assistant_event_handler import EventHandler
+from .assistant_event_handler import EventHandler, ToolCallRunner, get_run_token_usage
 from .operations import *
 
 logger = get_logger(LOGGER_NAME)
 
 
+class RunRegistry:
+    ''' process wide record of the runs started with a run handle: the tool calls already answered and a lock, so
+    that the tool calls of a requires_action are run once even when several polls of the run observe it '''
+
+    def __init__(self, max_size=RUN_REGISTRY_MAX_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, run_id):
+        with self._lock:
+            entry = self._entries.get(run_id)
+            if entry is None:
+                entry = self._entries[run_id] = {'lock': threading.Lock(), 'tool_calls': {}}
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+            self._entries.move_to_end(run_id)
+            return entry
+
+    def discard(self, run_id):
+        with self._lock:
+            self._entries.pop(run_id, None)
+
+
+run_registry = RunRegistry()
+
+
 class AssistantManager:
 
     def __init__(self, config, params):
@@ -22,15 +52,17 @@ class AssistantManager:
             self.tool_choice = self.params['tool_choice']
 
     def get_llm_response(self):
+        self.create_message()
+        assistant_response = self.run_assistant()
+        return assistant_response
+
+    def create_message(self):
         payload = {'thread_id': self.params['thread_id'], 'role': self.params['role'],
                    'content': self.params['content']}
         self.message_detail = create_thread_message(config=self.config, params=payload)
-        assistant_response = self.run_assistant()
-        return assistant_response
 
     def run_assistant(self, instructions=""):
-        client = openai.OpenAI(api_key=self.config['apiKey'], project=self.config.get('project'),
-                               organization=self.config.get('organization'))
+        client = get_client(self.config)
         event_handler = EventHandler(config=self.config, params=self.params,
                                      last_message_id=self.message_detail.get("id"))
         response_format = self.params.get('response_format') or None
@@ -45,9 +77,132 @@ class AssistantManager:
                 response_format=response_format
         ) as stream:
             stream.until_done()
-        return {"llm_response": event_handler.get_thread_messages(), "token_usage": event_handler.token_usage}
+        return {"llm_response": event_handler.get_thread_messages(), "token_usage": event_handler.token_usage,
+                "run_wait": event_handler.run_wait, "tool_calls": event_handler.tool_calls}
+
+    def start_run(self, instructions=""):
+        ''' adds the message and starts the run without waiting for it, returns the handle to poll the run with '''
+        self.create_message()
+        run = get_client(self.config).beta.threads.runs.create(
+            thread_id=self.params['thread_id'],
+            assistant_id=self.params['assistant_id'],
+            instructions=instructions,
+            tool_choice=self.tool_choice,
+            response_format=self.params.get('response_format') or None
+        )
+        # a plain dict, so that the handle can be passed on to the playbook step that collects the response
+        return {'thread_id': run.thread_id, 'run_id': run.id, 'assistant_id': run.assistant_id,
+                'last_message_id': self.message_detail.get('id'), 'status': run.status, 'cancelled': False,
+                'tool_calls': [], 'params': self.params}
+
+    def poll_run(self, run_handle):
+        ''' checks the run once; the call that finds it waiting for tool outputs runs the tool calls and submits
+        them, a run in a terminal status is collected into the response of get_llm_response '''
+        client = get_client(self.config)
+        run = client.beta.threads.runs.retrieve(thread_id=run_handle['thread_id'], run_id=run_handle['run_id'])
+        entry = run_registry.get(run.id)
+        if run.status == 'requires_action' and not run_handle['cancelled']:
+            run = self.handle_requires_action(run, run_handle, entry)
+        # the tool calls answered by other polls of this process, the handle carries those of other processes
+        tool_calls = {tool_call['tool_call_id']: tool_call for tool_call in run_handle['tool_calls']}
+        tool_calls.update(entry['tool_calls'])
+        run_handle.update({'status': run.status, 'tool_calls': list(tool_calls.values())})
+        if run.status not in RUN_TERMINAL_STATUSES:
+            return {'status': run.status, 'completed': False, 'run_handle': run_handle}
+        run_registry.discard(run.id)
+        if run.status != 'completed':
+            logger.warning(f'Run {run.id} ended with status {run.status}: {run.last_error}')
+        thread_messages = list_thread_messages(config=self.config,
+                                               params={'thread_id': run_handle['thread_id'],
+                                                       'before': run_handle['last_message_id']})
+        run_usage = run.usage.model_dump() if run.usage else None
+        token_usage = get_run_token_usage(run_usage, [tool_call['token_usage'] for tool_call in tool_calls.values()])
+        return {'status': run.status, 'completed': True, 'run_handle': run_handle, 'llm_response': thread_messages,
+                'token_usage': token_usage,
+                'tool_calls': [{key: value for key, value in tool_call.items() if key != 'token_usage'}
+                               for tool_call in tool_calls.values()]}
+
+    def handle_requires_action(self, run, run_handle, entry):
+        tools = [tool for tool in run.required_action.submit_tool_outputs.tool_calls if tool.type == 'function']
+        answered = {tool_call['tool_call_id'] for tool_call in run_handle['tool_calls']}
+        # another poll of this process is running the tool calls, the run is reported as is
+        if not entry['lock'].acquire(blocking=False):
+            return run
+        try:
+            answered.update(entry['tool_calls'])
+            if all(tool.id in answered for tool in tools):
+                return run
+            tool_runner = ToolCallRunner(self.config, self.params)
+            results = tool_runner.run_tool_calls(tools)
+            entry['tool_calls'].update({result.tool_call_id: dict(result.summary(), token_usage=result.token_usage)
+                                        for result in results})
+            tool_outputs, run_handle['cancelled'] = tool_runner.get_tool_outputs(run.id, results)
+            client = get_client(self.config)
+            if run_handle['cancelled']:
+                return client.beta.threads.runs.retrieve(thread_id=run.thread_id, run_id=run.id)
+            try:
+                return client.beta.threads.runs.submit_tool_outputs(thread_id=run.thread_id, run_id=run.id,
+                                                                    tool_outputs=tool_outputs)
+            except BadRequestError:
+                # the outputs were submitted by a poll in another process or the run ended meanwhile
+                logger.warning(f'Tool output not submitted, run {run.id} no longer requires action')
+                return client.beta.threads.runs.retrieve(thread_id=run.thread_id, run_id=run.id)
+        finally:
+            entry['lock'].release()
 
 
 def get_llm_response(config, params):
     assistant = AssistantManager(config, params)
     return assistant.get_llm_response()
+
+
+def load_run_handle(params):
+    run_handle = params.get('run_handle')
+    if isinstance(run_handle, str):
+        try:
+            run_handle = json.loads(run_handle)
+        except ValueError:
+            raise ConnectorError('Run handle must be the JSON object returned by start_llm_response.')
+    if not isinstance(run_handle, dict) or not run_handle.get('run_id') or not run_handle.get('thread_id'):
+        raise ConnectorError('Run handle must be the JSON object returned by start_llm_response.')
+    run_handle.setdefault('tool_calls', [])
+    run_handle.setdefault('cancelled', False)
+    # the tool call settings of the start call, unless the collecting call overrides them
+    return run_handle, dict(run_handle.get('params') or {}, **{key: value for key, value in params.items()
+                                                               if key != 'run_handle' and value not in [None, '']})
+
+
+def start_llm_response(config, params):
+    assistant = AssistantManager(config, params)
+    return assistant.start_run()
+
+
+def poll_llm_response(config, params):
+    run_handle, run_params = load_run_handle(params)
+    return AssistantManager(config, run_params).poll_run(run_handle)
+
+
+def await_llm_response(config, params):
+    ''' polls the run with adaptive backoff until it reaches a terminal status or the wait timeout '''
+    run_handle, run_params = load_run_handle(params)
+    assistant = AssistantManager(config, run_params)
+    wait_timeout = float(run_params.get('wait_timeout') or RUN_WAIT_TIMEOUT)
+    interval = RUN_POLL_INITIAL_INTERVAL
+    start = time.monotonic()
+    polls = 0
+    while True:
+        status = run_handle['status']
+        response = assistant.poll_run(run_handle)
+        polls += 1
+        if response['completed']:
+            response['run_wait'] = {'polls': polls, 'wait_time': round(time.monotonic() - start, 3)}
+            return response
+        remaining = wait_timeout - (time.monotonic() - start)
+        if remaining <= 0:
+            raise ConnectorError('Run {0} did not complete within {1} seconds, last status: {2}'.format(
+                run_handle['run_id'], wait_timeout, response['status']))
+        # the run made progress, e.g. tool outputs were submitted, poll it again soon
+        if response['status'] != status:
+            interval = RUN_POLL_INITIAL_INTERVAL
+        time.sleep(min(interval, remaining))
+        interval = min(interval * RUN_POLL_BACKOFF_FACTOR, RUN_POLL_MAX_INTERVAL)
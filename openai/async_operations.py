@@ -0,0 +1,389 @@
+"""
+Copyright start
+MIT License
+Copyright (c) 2025 Fortinet Inc
+Copyright end
+"""
+import time
+import asyncio
+from .operations import *
+from .assistant_manager import get_llm_response, start_llm_response, poll_llm_response, load_run_handle, \
+    AssistantManager
+from .client_pool import get_async_client, async_client_pool, report_operation
+from .retry import current_operation, execution_retries
+from .rate_limiter import execution_waits
+from .speech import plan_speech, synthesize_segment_async, finish_speech, remove_part_files, get_speech_stats
+
+logger = get_logger(LOGGER_NAME)
+
+# operation: (client resource, payload builder) for the operations that map one-to-one on an API call
+ASYNC_RESOURCES = {
+    'create_assistant': ('beta.assistants.create', build_request_payload),
+    'list_assistants': ('beta.assistants.list', build_list_payload),
+    'get_assistant': ('beta.assistants.retrieve', build_request_payload),
+    'delete_assistant': ('beta.assistants.delete', build_request_payload),
+    'update_assistant': ('beta.assistants.update', build_request_payload),
+
+    'get_thread': ('beta.threads.retrieve', build_request_payload),
+    'delete_thread': ('beta.threads.delete', build_request_payload),
+    'update_thread': ('beta.threads.update', build_request_payload),
+    'create_thread': ('beta.threads.create', build_request_payload),
+
+    'create_thread_message': ('beta.threads.messages.create', build_thread_message_payload),
+    'list_thread_messages': ('beta.threads.messages.list', build_list_payload),
+    'delete_thread_message': ('beta.threads.messages.delete', build_request_payload),
+    'get_thread_message': ('beta.threads.messages.retrieve', build_request_payload),
+    'update_thread_message': ('beta.threads.messages.update', build_request_payload),
+
+    'list_runs': ('beta.threads.runs.list', build_list_payload),
+    'get_run': ('beta.threads.runs.retrieve', build_request_payload),
+    'create_run': ('beta.threads.runs.create', build_run_payload),
+    'update_run': ('beta.threads.runs.update', build_request_payload),
+    'cancel_run': ('beta.threads.runs.cancel', build_request_payload),
+    'create_thread_and_run': ('beta.threads.create_and_run', build_run_payload),
+    'submit_tool_outputs_to_run': ('beta.threads.runs.submit_tool_outputs', build_request_payload),
+
+    'list_run_steps': ('beta.threads.runs.steps.list', build_list_payload),
+    'get_run_step': ('beta.threads.runs.steps.retrieve', build_request_payload),
+
+    'create_vector_store': ('beta.vector_stores.create', build_vector_store_payload),
+    'get_vector_store': ('beta.vector_stores.retrieve', build_request_payload),
+    'create_vector_store_file': ('beta.vector_stores.files.create', build_request_payload),
+
+    'create_vector_store_file_batch': ('beta.vector_stores.file_batches.create', build_file_batch_payload),
+    'get_vector_store_file_batch': ('beta.vector_stores.file_batches.retrieve', build_request_payload),
+    'cancel_vector_store_file_batch': ('beta.vector_stores.file_batches.cancel', build_request_payload),
+
+    'get_file': ('files.retrieve', build_request_payload),
+    'list_files': ('files.list', build_list_files_payload),
+
+    'get_batch': ('batches.retrieve', build_request_payload),
+    'cancel_batch': ('batches.cancel', build_request_payload)
+}
+
+
+def _get_resource_method(client, resource):
+    method = client
+    for name in resource.split('.'):
+        method = getattr(method, name)
+    return method
+
+
+def _async_operation(resource, payload_builder):
+    async def operation(config, params, *args, **kwargs):
+        payload = payload_builder(params)
+        method = _get_resource_method(get_async_client(config), resource)
+        response = await method(**payload)
+        return response.model_dump()
+    return operation
+
+
+def _uploading_operation(operation, function, *keys):
+    ''' an operation that can upload its files first or wait for its result; when one of these options is set the
+    synchronous operation runs in a worker thread '''
+    async def run(config, params, *args, **kwargs):
+        if any(params.get(key) for key in keys):
+            return await asyncio.to_thread(function, config, params, *args, **kwargs)
+        for key in keys:
+            params.pop(key, None)
+        return await operation(config, params, *args, **kwargs)
+    return run
+
+
+async def ingest_files_to_vector_store_async(config, params, *args, **kwargs):
+    # the uploads and the batch polling run in the synchronous helpers, which bound their own concurrency
+    return await asyncio.to_thread(ingest_files_to_vector_store, config, params, *args, **kwargs)
+
+
+def _threaded_operation(function):
+    ''' runs an operation that has no async API call (local computation or a blocking helper) off the event loop '''
+    async def operation(config, params, *args, **kwargs):
+        return await asyncio.to_thread(function, config, params)
+    return operation
+
+
+async def create_chat_completion_async(config, params, openai_args, **kwargs):
+    if not (params.get('stream') or openai_args.pop('stream', False)):
+        cache, key, response = get_cached_completion(config, params, openai_args)
+        if response is not None:
+            return response
+        response = await get_async_client(config).chat.completions.create(**openai_args)
+        return cache_completion(cache, key, params, response.model_dump()) if cache else response.model_dump()
+    with open_stream_sink(params, **kwargs) as sink:
+        accumulator = ChatCompletionAccumulator(sink)
+        stream = await get_async_client(config).chat.completions.create(**build_stream_args(openai_args))
+        async with stream:
+            async for chunk in stream:
+                accumulator.add(chunk)
+    return accumulator.result()
+
+
+async def chat_completions_async(config, params, *args, **kwargs):
+    openai_args = build_chat_args(config, params)
+    # counting the tokens of a long conversation is CPU bound, keep it off the event loop
+    context_fit = await asyncio.to_thread(fit_chat_context, config, params, openai_args)
+    response = await create_chat_completion_async(config, params, openai_args, **kwargs)
+    if context_fit:
+        response['context_fit'] = context_fit
+    return response
+
+
+def get_concurrency(params, default):
+    concurrency = params.get('concurrency')
+    if concurrency in (None, ''):
+        return default
+    try:
+        concurrency = int(concurrency)
+    except (TypeError, ValueError):
+        concurrency = 0
+    if concurrency < 1:
+        raise ConnectorError('Concurrency must be a whole number of at least 1, got {0}.'.format(
+            params.get('concurrency')))
+    return concurrency
+
+
+def _build_batch_item_params(params, item):
+    # the items run concurrently, a stream file would be truncated and written by all of them at once
+    item_params = {key: value for key, value in params.items()
+                   if key not in ['messages_list', 'concurrency', 'stream', 'stream_file_path']}
+    if isinstance(item, str):
+        item_params.update({'operation': 'chat_completions', 'message': item})
+    elif isinstance(item, dict) and 'message' in item:
+        item_params.update({'operation': 'chat_completions', 'message': item['message']})
+    elif isinstance(item, (list, tuple)):
+        item_params.update({'operation': 'chat_conversation', 'messages': [dict(message) for message in item]})
+    else:
+        raise ConnectorError('Each item must be a message string, a {"message": ...} object or a list of messages.')
+    return item_params
+
+
+async def chat_completions_batch_async(config, params, *args, **kwargs):
+    messages_list = params.get('messages_list') or []
+    if isinstance(messages_list, str):
+        messages_list = json.loads(messages_list)
+    semaphore = asyncio.Semaphore(get_concurrency(params, CHAT_BATCH_CONCURRENCY))
+
+    async def run(index, item):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await chat_completions_async(config, _build_batch_item_params(params, item),
+                                                        *args, **kwargs)
+                return {'index': index, 'status': 'Success', 'response': response,
+                        'latency': round(time.perf_counter() - start, 3)}
+            except Exception as err:
+                logger.error('Chat completion of item {0} failed: {1}'.format(index, err))
+                return {'index': index, 'status': 'Failed', 'error': str(err),
+                        'latency': round(time.perf_counter() - start, 3)}
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(run(index, item) for index, item in enumerate(messages_list)))
+    elapsed = time.perf_counter() - start
+    usage = {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
+    for result in results:
+        for key, value in ((result.get('response') or {}).get('usage') or {}).items():
+            if key in usage and isinstance(value, int):
+                usage[key] += value
+    latencies = [result['latency'] for result in results]
+    succeeded = len([result for result in results if result['status'] == 'Success'])
+    return {
+        'results': results,
+        'summary': {
+            'total': len(results),
+            'succeeded': succeeded,
+            'failed': len(results) - succeeded,
+            'elapsed_time': round(elapsed, 3),
+            'average_latency': round(sum(latencies) / len(latencies), 3) if latencies else 0,
+            'max_latency': max(latencies) if latencies else 0,
+            'usage': usage
+        }
+    }
+
+
+def chat_completions_batch(config, params, *args, **kwargs):
+    return run_on_event_loop(chat_completions_batch_async(config, params, *args, **kwargs))
+
+
+async def list_models_async(config, params, *args, **kwargs):
+    response = await get_async_client(config).models.list()
+    return response.model_dump()
+
+
+async def create_speech_async(config, params, *args, **kwargs):
+    env = kwargs.get('env', {})
+    speech_file_path, payload = build_speech_payload(params)
+    start = time.perf_counter()
+    response_format, segments, part_paths, workers = plan_speech(payload, speech_file_path)
+    client = get_async_client(config)
+    semaphore = asyncio.Semaphore(workers)
+
+    async def synthesize(text, path):
+        async with semaphore:
+            return await synthesize_segment_async(client, payload, text, path, start)
+
+    try:
+        first_bytes = await asyncio.gather(*(synthesize(text, path) for text, path in zip(segments, part_paths)))
+        size = await asyncio.to_thread(finish_speech, speech_file_path, part_paths, response_format)
+    finally:
+        remove_part_files(part_paths)
+    return_path = str(speech_file_path)
+    save_file_in_env(env, return_path)
+    return dict({'path': return_path}, **get_speech_stats(segments, first_bytes, size, start))
+
+
+async def create_transcription_async(config, params, *args, **kwargs):
+    if params.get('segmented'):
+        # the segments are sent by a thread pool reading the WAV file with pread
+        return await asyncio.to_thread(create_transcription, config, params, *args, **kwargs)
+    payload = await asyncio.to_thread(build_transcription_payload, params, kwargs.get('env', {}))
+    with payload['file'][1]:
+        response = await get_async_client(config).audio.transcriptions.create(**payload)
+    return response.model_dump()
+
+
+async def create_translation_async(config, params, *args, **kwargs):
+    payload = await asyncio.to_thread(build_translation_payload, params, kwargs.get('env', {}))
+    with payload['file'][1]:
+        response = await get_async_client(config).audio.translations.create(**payload)
+    return response.model_dump()
+
+
+async def upload_file_async(config, params, *args, **kwargs):
+    if params.get('deduplicate'):
+        # the content hash and the file index lookups are blocking, the upload runs with them in a worker thread
+        return await asyncio.to_thread(upload_file, config, params, *args, **kwargs)
+    payload = await asyncio.to_thread(build_upload_payload, params, kwargs.get('env', {}))
+    filename, file = payload['file']
+    with file:
+        if is_multipart_upload(file):
+            # the parts are sent from a thread pool with the pooled synchronous client
+            response = await asyncio.to_thread(upload_file_in_parts, config, filename, file, payload['purpose'])
+        else:
+            response = await get_async_client(config).files.create(**payload)
+    return response.model_dump()
+
+
+async def await_llm_response_async(config, params, *args, **kwargs):
+    ''' awaits many runs on one event loop: a worker thread is only taken for each poll, not for the whole run '''
+    run_handle, run_params = load_run_handle(params)
+    assistant = AssistantManager(config, run_params)
+    wait_timeout = float(run_params.get('wait_timeout') or RUN_WAIT_TIMEOUT)
+    interval = RUN_POLL_INITIAL_INTERVAL
+    start = time.monotonic()
+    polls = 0
+    while True:
+        status = run_handle['status']
+        response = await asyncio.to_thread(assistant.poll_run, run_handle)
+        polls += 1
+        if response['completed']:
+            response['run_wait'] = {'polls': polls, 'wait_time': round(time.monotonic() - start, 3)}
+            return response
+        remaining = wait_timeout - (time.monotonic() - start)
+        if remaining <= 0:
+            raise ConnectorError('Run {0} did not complete within {1} seconds, last status: {2}'.format(
+                run_handle['run_id'], wait_timeout, response['status']))
+        if response['status'] != status:
+            interval = RUN_POLL_INITIAL_INTERVAL
+        await asyncio.sleep(min(interval, remaining))
+        interval = min(interval * RUN_POLL_BACKOFF_FACTOR, RUN_POLL_MAX_INTERVAL)
+
+
+async_supported_operations = {operation: _async_operation(resource, payload_builder)
+                              for operation, (resource, payload_builder) in ASYNC_RESOURCES.items()}
+async_supported_operations.update({
+    'chat_completions': chat_completions_async,
+    'chat_conversation': chat_completions_async,
+    'chat_completions_batch': chat_completions_batch_async,
+    'list_models': list_models_async,
+    'get_usage': _threaded_operation(get_usage),
+    'count_tokens': _threaded_operation(count_tokens),
+
+    'create_speech': create_speech_async,
+    'create_transcription': create_transcription_async,
+    'create_translation': create_translation_async,
+
+    'upload_file': upload_file_async,
+    'create_vector_store_file': _uploading_operation(async_supported_operations['create_vector_store_file'],
+                                                     create_vector_store_file, 'file'),
+    'create_vector_store_file_batch': _uploading_operation(
+        async_supported_operations['create_vector_store_file_batch'], create_vector_store_file_batch, 'files', 'wait',
+        'wait_timeout'),
+    'ingest_files_to_vector_store': ingest_files_to_vector_store_async,
+    'create_batch': _threaded_operation(create_batch),
+    'get_batch_results': _threaded_operation(get_batch_results),
+    # the assistant run is driven by the SDK's synchronous stream event handler
+    'get_llm_response': _threaded_operation(get_llm_response),
+    'start_llm_response': _threaded_operation(start_llm_response),
+    'poll_llm_response': _threaded_operation(poll_llm_response),
+    'await_llm_response': await_llm_response_async
+})
+
+
+async def execute_async(config, operation, params, *args, **kwargs):
+    if operation in ['chat_conversation', 'chat_completions']:
+        params.update({'operation': operation})
+    async_operation = async_supported_operations.get(operation)
+    if not async_operation:
+        raise ConnectorError('Unsupported operation: {0}'.format(operation))
+    # each task runs in its own copy of the context, so the operation name does not leak between tasks
+    current_operation.set(operation)
+    execution_retries.set([])
+    execution_waits.set([])
+    try:
+        return await async_operation(config, params, *args, **kwargs)
+    finally:
+        report_operation(config, operation, execution_retries.get(), execution_waits.get())
+
+
+async def execute_many_async(config, operations, concurrency=ASYNC_MAX_CONCURRENCY, *args, **kwargs):
+    ''' runs [{'operation': ..., 'params': {...}}, ...] concurrently, results are returned in input order '''
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(request):
+        async with semaphore:
+            try:
+                data = await execute_async(config, request.get('operation'), request.get('params') or {},
+                                           *args, **kwargs)
+                return {'status': 'Success', 'data': data}
+            except Exception as err:
+                logger.exception(err)
+                return {'status': 'Failed', 'message': str(err)}
+
+    return await asyncio.gather(*(run(request) for request in operations))
+
+
+def run_on_event_loop(coroutine):
+    ''' runs the coroutine to completion on a new event loop and closes the async clients opened on it '''
+    async def run():
+        try:
+            return await coroutine
+        finally:
+            await async_client_pool.aclose()
+    return asyncio.run(run())
+
+
+def execute_many(config, operations, concurrency=ASYNC_MAX_CONCURRENCY, *args, **kwargs):
+    ''' synchronous facade running many operations on one event loop with the shared async client '''
+    return run_on_event_loop(execute_many_async(config, operations, concurrency, *args, **kwargs))
+
+
+def execute_actions(config, params, *args, **kwargs):
+    ''' runs the listed actions concurrently; the event loop and the async client it opens are set up once for all of
+    them instead of once per action '''
+    actions = params.get('actions') or []
+    if isinstance(actions, str):
+        actions = json.loads(actions)
+    if not isinstance(actions, list) or not all(isinstance(action, dict) for action in actions):
+        raise ConnectorError('Actions must be a list of {"operation": ..., "params": {...}} objects.')
+    start = time.perf_counter()
+    results = execute_many(config, actions, get_concurrency(params, ASYNC_MAX_CONCURRENCY), *args, **kwargs)
+    succeeded = len([result for result in results if result['status'] == 'Success'])
+    return {
+        'results': results,
+        'summary': {
+            'total': len(results),
+            'succeeded': succeeded,
+            'failed': len(results) - succeeded,
+            'elapsed_time': round(time.perf_counter() - start, 3)
+        }
+    }
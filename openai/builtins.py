@@ -5,58 +5,70 @@ MIT License
 Copyright (c) 2025 Fortinet Inc
 Copyright end
 """
-from .operations import *
-from .assistant_manager import *
-
-supported_operations = {
-    'chat_completions': chat_completions,
-    'chat_conversation': chat_completions,
-    'list_models': list_models,
-    'get_usage': get_usage,
-    'count_tokens': count_tokens,
-
-    'create_assistant': create_assistant,
-    'list_assistants': list_assistants,
-    'get_assistant': get_assistant,
-    'delete_assistant': delete_assistant,
-    'update_assistant': update_assistant,
-
-    'get_thread': get_thread,
-    'delete_thread': delete_thread,
-    'update_thread': update_thread,
-    'create_thread': create_thread,
-
-    'create_thread_message': create_thread_message,
-    'list_thread_messages': list_thread_messages,
-    'delete_thread_message': delete_thread_message,
-    'get_thread_message': get_thread_message,
-    'update_thread_message': update_thread_message,
-
-    'list_runs': list_runs,
-    'get_run': get_run,
-    'create_run': create_run,
-    'update_run': update_run,
-    'cancel_run': cancel_run,
-    'create_thread_and_run': create_thread_and_run,
-    'submit_tool_outputs_to_run': submit_tool_outputs_to_run,
-
-    'list_run_steps': list_run_steps,
-    'get_run_step': get_run_step,
-
-    'create_vector_store': create_vector_store,
-    'get_vector_store': get_vector_store,
-    'create_vector_store_file': create_vector_store_file,
-
-    'create_vector_store_file_batch': create_vector_store_file_batch,
-    'get_vector_store_file_batch': get_vector_store_file_batch,
-    'cancel_vector_store_file_batch': cancel_vector_store_file_batch,
-
-    'create_speech': create_speech,
-    'create_transcription': create_transcription,
-    'create_translation': create_translation,
-
-    'get_file': get_file,
-    'list_files': list_files,
-    'upload_file': upload_file,
-    'get_llm_response': get_llm_response
-    }
\ No newline at end of file
+from .lazy_loader import LazyOperations
+
+supported_operations = LazyOperations({
+    'chat_completions': 'operations.chat_completions',
+    'chat_conversation': 'operations.chat_completions',
+    'chat_completions_batch': 'async_operations.chat_completions_batch',
+    'list_models': 'operations.list_models',
+    'get_usage': 'operations.get_usage',
+    'count_tokens': 'operations.count_tokens',
+
+    'create_assistant': 'operations.create_assistant',
+    'list_assistants': 'operations.list_assistants',
+    'get_assistant': 'operations.get_assistant',
+    'delete_assistant': 'operations.delete_assistant',
+    'update_assistant': 'operations.update_assistant',
+
+    'get_thread': 'operations.get_thread',
+    'delete_thread': 'operations.delete_thread',
+    'update_thread': 'operations.update_thread',
+    'create_thread': 'operations.create_thread',
+
+    'create_thread_message': 'operations.create_thread_message',
+    'list_thread_messages': 'operations.list_thread_messages',
+    'delete_thread_message': 'operations.delete_thread_message',
+    'get_thread_message': 'operations.get_thread_message',
+    'update_thread_message': 'operations.update_thread_message',
+
+    'list_runs': 'operations.list_runs',
+    'get_run': 'operations.get_run',
+    'create_run': 'operations.create_run',
+    'update_run': 'operations.update_run',
+    'cancel_run': 'operations.cancel_run',
+    'create_thread_and_run': 'operations.create_thread_and_run',
+    'submit_tool_outputs_to_run': 'operations.submit_tool_outputs_to_run',
+
+    'list_run_steps': 'operations.list_run_steps',
+    'get_run_step': 'operations.get_run_step',
+
+    'create_vector_store': 'operations.create_vector_store',
+    'get_vector_store': 'operations.get_vector_store',
+    'create_vector_store_file': 'operations.create_vector_store_file',
+
+    'create_vector_store_file_batch': 'operations.create_vector_store_file_batch',
+    'get_vector_store_file_batch': 'operations.get_vector_store_file_batch',
+    'cancel_vector_store_file_batch': 'operations.cancel_vector_store_file_batch',
+    'ingest_files_to_vector_store': 'operations.ingest_files_to_vector_store',
+
+    'create_speech': 'operations.create_speech',
+    'create_transcription': 'operations.create_transcription',
+    'create_translation': 'operations.create_translation',
+
+    'get_file': 'operations.get_file',
+    'list_files': 'operations.list_files',
+    'upload_file': 'operations.upload_file',
+
+    'create_batch': 'operations.create_batch',
+    'get_batch': 'operations.get_batch',
+    'cancel_batch': 'operations.cancel_batch',
+    'get_batch_results': 'operations.get_batch_results',
+
+    'execute_actions': 'async_operations.execute_actions',
+
+    'get_llm_response': 'assistant_manager.get_llm_response',
+    'start_llm_response': 'assistant_manager.start_llm_response',
+    'poll_llm_response': 'assistant_manager.poll_llm_response',
+    'await_llm_response': 'assistant_manager.await_llm_response'
+    })
\ No newline at end of file
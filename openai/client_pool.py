@@ -0,0 +1,292 @@
+"""
+Copyright start
+MIT License
+Copyright (c) 2025 Fortinet Inc
+Copyright end
+"""
+import os
+import time
+import hashlib
+import weakref
+import threading
+from collections import OrderedDict
+
+from connectors.core.connector import get_logger
+from .constants import *
+from .rate_limiter import RateLimiter
+from .retry import RetryPolicy
+from .tokenizer import EncodingRegistry
+
+logger = get_logger(LOGGER_NAME)
+
+
+def _get_proxy(base_url):
+    https_proxy = os.environ.get('HTTPS_PROXY')
+    no_proxy = os.environ.get('NO_PROXY', 'localhost')
+    if https_proxy and base_url not in no_proxy:
+        return https_proxy
+    return None
+
+
+def get_client_key(config):
+    ''' builds the pool key identifying the clients that can be shared for the given configuration '''
+    api_key = config.get('apiKey') or ''
+    api_type = 'azure' if config.get('api_type') else 'openai'
+    base_url = config.get('api_base') if config.get('api_type') else 'api.openai.com'
+    return (
+        hashlib.sha256(api_key.encode('utf-8')).hexdigest(),
+        base_url,
+        api_type,
+        config.get('api_version') if config.get('api_type') else None,
+        config.get('project'),
+        config.get('organization'),
+        config.get('deployment_id') if config.get('api_type') else None,
+        config.get('verify_ssl'),
+        _get_proxy(base_url)
+    )
+
+
+def _get_limit(config, name):
+    try:
+        return int(config.get(name)) or None
+    except (TypeError, ValueError):
+        return None
+
+
+rate_limiters = {}
+rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limit_key(config):
+    ''' the quota the requests of the configuration count against: the account, its endpoint and, on Azure, the
+    deployment; configurations that only differ in transport settings, such as the API version or the proxy,
+    share it '''
+    api_key_hash, base_url, api_type, api_version, project, organization, deployment = get_client_key(config)[:7]
+    return api_key_hash, base_url, api_type, project, organization, deployment
+
+
+def get_rate_limiter(config):
+    ''' returns the rate limiter shared by every client and REST call made against the quota of the configuration '''
+    key = get_rate_limit_key(config)
+    requests_per_minute = _get_limit(config, 'requests_per_minute')
+    tokens_per_minute = _get_limit(config, 'tokens_per_minute')
+    with rate_limiters_lock:
+        rate_limiter = rate_limiters.get(key)
+        if rate_limiter is None:
+            rate_limiter = rate_limiters[key] = RateLimiter(requests_per_minute, tokens_per_minute)
+    rate_limiter.configure(requests_per_minute, tokens_per_minute)
+    return rate_limiter
+
+
+retry_policies = {}
+retry_policies_lock = threading.Lock()
+
+
+def get_retry_policy(config, key=None):
+    ''' returns the retry policy shared by every client, REST call and polling loop of the configuration '''
+    key = key or get_client_key(config)
+    with retry_policies_lock:
+        retry_policy = retry_policies.get(key)
+        if retry_policy is None:
+            retry_policy = retry_policies[key] = RetryPolicy(config)
+    retry_policy.configure(config)
+    return retry_policy
+
+
+def report_operation(config, operation, retries, waits):
+    ''' logs the retries and the rate limit queueing of one execution of the operation, if it had any '''
+    key = get_client_key(config)
+    if retries:
+        get_retry_policy(config, key).report(operation, retries)
+    if waits:
+        get_rate_limiter(config).report(operation, waits)
+
+
+def refresh_client_policies(config, key):
+    ''' applies the current rate limit and retry settings of the configuration to its pooled clients '''
+    get_rate_limiter(config)
+    get_retry_policy(config, key)
+
+
+def build_client(config, key, is_async=False):
+    # the SDK and the HTTP stack are imported on the first client, operations that make no API call do not pay for it
+    import httpx
+    import openai
+    from .transports import RateLimitedTransport, AsyncRateLimitedTransport, RetryTransport, AsyncRetryTransport
+    transport_args = {
+        'proxy': key[-1],
+        'verify': config.get('verify_ssl'),
+        'limits': httpx.Limits(max_connections=CLIENT_POOL_MAX_CONNECTIONS,
+                               max_keepalive_connections=CLIENT_POOL_MAX_KEEPALIVE_CONNECTIONS,
+                               keepalive_expiry=CLIENT_POOL_KEEPALIVE_EXPIRY)
+    }
+    rate_limiter = get_rate_limiter(config)
+    retry_policy = get_retry_policy(config, key)
+    # the request tokens are estimated with the encodings of the configured tokenizer cache
+    cache_dir = EncodingRegistry.get_cache_dir(config)
+    # every retry attempt goes through the rate limiter again
+    if is_async:
+        transport = AsyncRateLimitedTransport(rate_limiter, httpx.AsyncHTTPTransport(**transport_args), cache_dir)
+        http_client = openai.DefaultAsyncHttpxClient(transport=AsyncRetryTransport(retry_policy, transport))
+    else:
+        transport = RateLimitedTransport(rate_limiter, httpx.HTTPTransport(**transport_args), cache_dir)
+        http_client = openai.DefaultHttpxClient(transport=RetryTransport(retry_policy, transport))
+    client_args = {
+        'api_key': config.get('apiKey'),
+        # retries are handled by the configured retry policy of the transport
+        'max_retries': 0,
+        'organization': config.get('organization') or None,
+        'project': config.get('project') or None,
+        'http_client': http_client
+    }
+    if config.get('api_type'):
+        base_url = config.get('api_base').strip('/')
+        if not base_url.startswith('http'):
+            base_url = 'https://{0}'.format(base_url)
+        client_class = openai.AsyncAzureOpenAI if is_async else openai.AzureOpenAI
+        client = client_class(azure_endpoint=base_url, api_version=config.get('api_version'), **client_args)
+    else:
+        client_class = openai.AsyncOpenAI if is_async else openai.OpenAI
+        client = client_class(**client_args)
+    if not is_async:
+        # a client dropped from the pool may still be in use by other threads, its connections are closed once the
+        # last of them releases it
+        weakref.finalize(client, _close_http_client, http_client)
+    return client
+
+
+def _close_http_client(http_client):
+    try:
+        http_client.close()
+    except Exception as err:
+        logger.warning('Error occurred while closing the OpenAI client: {0}'.format(err))
+
+
+class ClientPool:
+    ''' bounded, thread-safe registry of long-lived keep-alive OpenAI clients keyed by configuration '''
+
+    def __init__(self, max_size=CLIENT_POOL_MAX_SIZE, idle_timeout=CLIENT_POOL_IDLE_TIMEOUT):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # one builder per configuration, so clients are built outside the pool lock without building a key twice
+        self._building = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, config):
+        key = get_client_key(config)
+        with self._lock:
+            client = self._lookup(key)
+            if client is None:
+                building = self._building.setdefault(key, threading.Lock())
+        if client is not None:
+            refresh_client_policies(config, key)
+            return client
+        with building:
+            # a concurrent caller may have built the client while this one waited for the builder lock
+            with self._lock:
+                client = self._lookup(key)
+            if client is not None:
+                refresh_client_policies(config, key)
+                return client
+            try:
+                client = build_client(config, key)
+                with self._lock:
+                    self.misses += 1
+                    self._entries[key] = {'client': client, 'last_used': time.monotonic()}
+                    while len(self._entries) > self.max_size:
+                        # evicted clients are not closed here, other threads may still be sending requests with them
+                        self._entries.popitem(last=False)
+                        self.evictions += 1
+            finally:
+                with self._lock:
+                    self._building.pop(key, None)
+        return client
+
+    def _lookup(self, key):
+        ''' the pooled client of the key marked as used, called with the pool lock held '''
+        now = time.monotonic()
+        self._drop_idle(now)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self.hits += 1
+        entry['last_used'] = now
+        self._entries.move_to_end(key)
+        return entry['client']
+
+    def _drop_idle(self, now):
+        idle = [key for key, entry in self._entries.items() if now - entry['last_used'] > self.idle_timeout]
+        self.evictions += len(idle)
+        for key in idle:
+            del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'max_size': self.max_size, 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions}
+
+
+class AsyncClientPool:
+    ''' registry of AsyncOpenAI clients; async connections are bound to the event loop that opened them, so
+    clients are shared per configuration within one event loop and closed together with aclose() '''
+
+    def __init__(self):
+        # keyed by event loop, only used from coroutines, so asyncio is already imported when it is needed
+        self._loops = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, config):
+        key = get_client_key(config)
+        import asyncio
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._loops.setdefault(loop, {}).get(key)
+            if client is not None:
+                self.hits += 1
+        if client is not None:
+            refresh_client_policies(config, key)
+            return client
+        # the coroutines of a loop run on one thread, so no other client of the key can be built for it meanwhile
+        client = build_client(config, key, is_async=True)
+        with self._lock:
+            self.misses += 1
+            self._loops.setdefault(loop, {})[key] = client
+        return client
+
+    async def aclose(self):
+        import asyncio
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            clients = self._loops.pop(loop, {})
+        for client in clients.values():
+            try:
+                await client.close()
+            except Exception as err:
+                logger.warning('Error occurred while closing the async OpenAI client: {0}'.format(err))
+
+    def stats(self):
+        with self._lock:
+            return {'event_loops': len(self._loops), 'size': sum(len(clients) for clients in self._loops.values()),
+                    'hits': self.hits, 'misses': self.misses}
+
+
+client_pool = ClientPool()
+async_client_pool = AsyncClientPool()
+
+
+def get_client(config):
+    return client_pool.get(config)
+
+
+def get_async_client(config):
+    return async_client_pool.get(config)
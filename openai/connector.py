@@ -4,25 +4,48 @@ MIT License
 Copyright (c) 2025 Fortinet Inc
 Copyright end
 """
-from connectors.core.connector import Connector, ConnectorError
+from connectors.core.connector import Connector, ConnectorError, get_logger
 from .builtins import *
 from .constants import LOGGER_NAME
 from .operations import check
+from .client_pool import report_operation
+from .rate_limiter import execution_waits
+from .retry import current_operation, execution_retries
+from .tokenizer import encoding_registry
 logger = get_logger(LOGGER_NAME)
 
 
 class Openai(Connector):
 
     def execute(self, config, operation, params, *args, **kwargs):
+        operation_token = current_operation.set(operation)
+        retries_token = execution_retries.set([])
+        waits_token = execution_waits.set([])
         try:
             if operation in ['chat_conversation', 'chat_completions']:
                 params.update({'operation': operation})
-            elif operation in ['create_speech', 'create_transcription', 'create_translation', 'upload_file']:
+                return supported_operations.get(operation)(config, params, *args, **kwargs)
+            elif operation in ['create_speech', 'create_transcription', 'create_translation', 'upload_file',
+                               'create_batch', 'create_vector_store_file', 'create_vector_store_file_batch',
+                               'ingest_files_to_vector_store', 'execute_actions', 'chat_completions_batch']:
                 return supported_operations.get(operation)(config, params, *args, **kwargs)
             return supported_operations.get(operation)(config, params)
         except Exception as err:
             logger.exception(err)
             raise ConnectorError("Message: {0}".format(err))
+        finally:
+            report_operation(config, operation, execution_retries.get(), execution_waits.get())
+            execution_waits.reset(waits_token)
+            execution_retries.reset(retries_token)
+            current_operation.reset(operation_token)
 
     def check_health(self, config=None, *args, **kwargs):
         return check(config)
+
+    def on_add_config(self, config, active):
+        if config.get('preload_tokenizer'):
+            encoding_registry.warm_up(config)
+
+    def on_update_config(self, old_config, new_config, active):
+        if new_config.get('preload_tokenizer'):
+            encoding_registry.warm_up(new_config)
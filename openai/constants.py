@@ -4,8 +4,12 @@ MIT License
 Copyright (c) 2025 Fortinet Inc
 Copyright end
 """
+
 LOGGER_NAME = 'openai'
 SCHEMA_ERROR = 'There was an error in your messages format, use this schema instead: [{\'role\': \'user\', \'content\': \'question1\'},{\'role\': \'assistant\', \'content\': \'response1\'},{\'role\': \'user\', \'content\': \'question2\'}]'
+# whitespace the HTML parser collapses when a text consists only of it
+HTML_ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+# content is a string, a list of content parts or null, as in assistant messages that only make tool calls
 MESSAGES_SCHEMA = {
     'type': 'array',
     'items': {
@@ -15,16 +19,132 @@ MESSAGES_SCHEMA = {
                 'type': 'string'
             },
             'content': {
-                'type': ['string']
+                'type': ['string', 'array', 'null']
+            },
+            'name': {
+                'type': 'string'
+            },
+            'tool_calls': {
+                'type': 'array',
+                'items': {
+                    'type': 'object',
+                    'properties': {
+                        'function': {
+                            'type': 'object'
+                        }
+                    }
+                }
             }
         },
         'required': [
-            'role',
-            'content'
+            'role'
         ]
     }
 }
 
+# Pooled OpenAI clients, keyed by configuration
+CLIENT_POOL_MAX_SIZE = 16
+CLIENT_POOL_IDLE_TIMEOUT = 1800
+CLIENT_POOL_KEEPALIVE_EXPIRY = 60
+CLIENT_POOL_MAX_CONNECTIONS = 1000
+CLIENT_POOL_MAX_KEEPALIVE_CONNECTIONS = 100
+
+# Retry policy defaults, matching the OpenAI SDK defaults
+RETRY_MAX_RETRIES = 2
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8.0
+RETRY_JITTER = 0.25
+RETRY_AFTER_MAX_DELAY = 60
+RETRY_STATUS_CODES = [408, 409, 429, 500, 502, 503, 504]
+RETRY_ERROR_TYPES = ['Connection Errors', 'Timeouts']
+
+# Assistant run completion wait
+RUN_TERMINAL_STATUSES = ['completed', 'cancelled', 'failed', 'expired', 'incomplete']
+RUN_POLL_INITIAL_INTERVAL = 0.5
+RUN_POLL_MAX_INTERVAL = 5.0
+RUN_POLL_BACKOFF_FACTOR = 1.5
+RUN_WAIT_TIMEOUT = 600
+# runs started with a run handle whose answered tool calls are remembered by the process
+RUN_REGISTRY_MAX_SIZE = 1024
+
+# Vector store file batch ingestion; a file batch takes at most 500 files
+FILE_BATCH_TERMINAL_STATUSES = ['completed', 'cancelled', 'failed']
+FILE_BATCH_MAX_FILES = 500
+FILE_BATCH_POLL_INITIAL_INTERVAL = 1.0
+FILE_BATCH_POLL_MAX_INTERVAL = 10.0
+FILE_BATCH_POLL_BACKOFF_FACTOR = 1.5
+FILE_BATCH_WAIT_TIMEOUT = 1800
+INGEST_UPLOAD_CONCURRENCY = 4
+
+# Token counting; the families resolve model names unknown to the installed tiktoken version
+TOKENIZER_DEFAULT_ENCODING = 'o200k_base'
+TOKENIZER_MODEL_FAMILIES = [
+    ('gpt-35', 'cl100k_base'),
+    ('gpt-3.5', 'cl100k_base'),
+    ('gpt-4-', 'cl100k_base'),
+    ('gpt-4', 'o200k_base'),
+    ('gpt-5', 'o200k_base'),
+    ('chatgpt', 'o200k_base'),
+    ('o1', 'o200k_base'),
+    ('o3', 'o200k_base'),
+    ('o4', 'o200k_base'),
+    ('text-embedding', 'cl100k_base')
+]
+TOKENIZER_WARM_UP_ENCODINGS = ['o200k_base', 'cl100k_base']
+TOKENIZER_LOAD_RETRY_INTERVAL = 300
+TOKENIZER_BATCH_THREADS = 8
+TOKENIZER_BATCH_MIN_SIZE = 16
+# (tokens per message, tokens per name, tokens priming the reply) of the chat format
+TOKENIZER_DEFAULT_MESSAGE_OVERHEAD = (3, 1, 3)
+TOKENIZER_MESSAGE_OVERHEAD = [
+    ('gpt-3.5-turbo-0301', (4, -1, 3)),
+    ('gpt-35-turbo-0301', (4, -1, 3))
+]
+
+# Context window sizes by model name prefix, more specific prefixes first
+MODEL_CONTEXT_WINDOWS = [
+    ('gpt-5', 400000),
+    ('gpt-4.1', 1047576),
+    ('gpt-4.5', 128000),
+    ('gpt-4o', 128000),
+    ('chatgpt-4o', 128000),
+    ('gpt-4-turbo', 128000),
+    ('gpt-4-1106', 128000),
+    ('gpt-4-0125', 128000),
+    ('gpt-4-vision', 128000),
+    ('gpt-4-32k', 32768),
+    ('gpt-4', 8192),
+    ('gpt-3.5-turbo-instruct', 4096),
+    ('gpt-3.5-turbo', 16385),
+    ('gpt-35-turbo-instruct', 4096),
+    ('gpt-35-turbo', 16385),
+    ('o1-mini', 128000),
+    ('o1-preview', 128000),
+    ('o1', 200000),
+    ('o3', 200000),
+    ('o4-mini', 200000)
+]
+# completion tokens reserved when the request does not set max_tokens
+CONTEXT_FIT_DEFAULT_COMPLETION_TOKENS = 1024
+# slack for the tokens local counting cannot see, e.g. tool definitions and response format
+CONTEXT_FIT_SAFETY_MARGIN = 64
+
+# Assistant tool calls of one requires_action event run concurrently
+TOOL_CALL_MAX_WORKERS = 5
+TOOL_CALL_TIMEOUT = 300
+TOOL_CALL_POLL_INTERVAL = 0.05
+
+# Opt-in chat completions response cache
+RESPONSE_CACHE_DEFAULT_TTL = 3600
+RESPONSE_CACHE_MAX_ENTRIES = 1024
+RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+RESPONSE_CACHE_DB_PATH = '/tmp/openai_connector_response_cache.sqlite3'
+RESPONSE_CACHE_DB_TIMEOUT = 5
+
+# Maximum number of operations in flight on one event loop
+ASYNC_MAX_CONCURRENCY = 100
+CHAT_BATCH_CONCURRENCY = 10
+
 USAGE_URL = 'https://api.openai.com/v1/usage'
 SORT_ORDER_MAPPING = {
     'Ascending': 'asc',
@@ -40,3 +160,41 @@ FILE_PURPOSE_MAPPING = {
     "Batch Output": "batch_output",
     "Fine-tune Results": "fine-tune-results"
 }
+
+# Text to speech; longer inputs are synthesized as segments of whole sentences joined in the formats that allow it
+SPEECH_MAX_INPUT_CHARS = 4096
+SPEECH_CONCATENABLE_FORMATS = ['mp3', 'wav', 'pcm']
+SPEECH_MAX_WORKERS = 4
+SPEECH_CHUNK_SIZE = 64 * 1024
+SPEECH_WAV_HEADER_MAX_SIZE = 4096
+
+# Segmented transcription of long WAV audio, each segment within the upload limit of the audio API
+TRANSCRIPTION_MAX_FILE_SIZE = 25 * 1024 * 1024
+TRANSCRIPTION_HEADER_SIZE = 44
+TRANSCRIPTION_HEADER_MAX_SIZE = 4096
+TRANSCRIPTION_SEGMENT_DURATION = 600
+TRANSCRIPTION_SEGMENT_OVERLAP = 2
+TRANSCRIPTION_MAX_WORKERS = 4
+TRANSCRIPTION_OVERLAP_MAX_WORDS = 50
+
+# Files larger than the threshold are sent in parts with the Uploads API, a part is at most 64 MB
+UPLOAD_MULTIPART_THRESHOLD = 64 * 1024 * 1024
+UPLOAD_PART_SIZE = 16 * 1024 * 1024
+UPLOAD_PART_CONCURRENCY = 4
+UPLOAD_STATE_DIR = '/tmp/openai_uploads'
+UPLOAD_EXPIRY_MARGIN = 300
+UPLOAD_FINGERPRINT_BLOCK_SIZE = 1024 * 1024
+UPLOAD_MIME_TYPES = {
+    '.jsonl': 'text/jsonl'
+}
+
+# Index of the uploaded files by content hash and purpose, to reuse them for identical content
+FILE_INDEX_DB_PATH = '/tmp/openai_connector_file_index.sqlite3'
+FILE_INDEX_DB_TIMEOUT = 5
+FILE_INDEX_MAX_ENTRIES = 10000
+FILE_INDEX_HASH_CHUNK_SIZE = 1024 * 1024
+
+BATCH_DEFAULT_ENDPOINT = '/v1/chat/completions'
+BATCH_COMPLETION_WINDOW = '24h'
+# body field of the requests given as a string, other endpoints take them as a chat message
+BATCH_TEXT_REQUEST_FIELDS = {'/v1/embeddings': 'input', '/v1/completions': 'prompt'}
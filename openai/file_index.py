@@ -0,0 +1,157 @@
+"""
+Copyright start
+MIT License
+Copyright (c) 2025 Fortinet Inc
+Copyright end
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import weakref
+import threading
+
+from connectors.core.connector import get_logger
+from .constants import *
+from .client_pool import get_client_key
+
+logger = get_logger(LOGGER_NAME)
+
+
+def get_account_key(config):
+    ''' files are shared by every configuration of the same account and project, whatever its API version or proxy '''
+    api_key_hash, base_url, api_type, api_version, project, organization = get_client_key(config)[:6]
+    canonical = json.dumps([api_key_hash, base_url, api_type, project, organization], separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def hash_file(file):
+    ''' SHA-256 of an open file read in chunks from its start, the file position is left unchanged '''
+    digest = hashlib.sha256()
+    fd = file.fileno()
+    offset = 0
+    while True:
+        chunk = os.pread(fd, FILE_INDEX_HASH_CHUNK_SIZE, offset)
+        if not chunk:
+            return digest.hexdigest()
+        digest.update(chunk)
+        offset += len(chunk)
+
+
+class FileIndex:
+    ''' on-disk index from the content hash and purpose of an uploaded file to its file id, shared by the worker
+    processes of the node; entries are checked against the API when used, not when the file is deleted; an index
+    that cannot be read or written, e.g. a locked database or a full disk, only costs the deduplication '''
+
+    def __init__(self, path=FILE_INDEX_DB_PATH, max_entries=FILE_INDEX_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        # the index holds account keys and file names, only the owner of the file can read it
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            os.fchmod(fd, 0o600)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+        connection = self._connect()
+        try:
+            connection.execute('CREATE TABLE IF NOT EXISTS files (account TEXT NOT NULL, sha256 TEXT NOT NULL, '
+                               'purpose TEXT NOT NULL, file_id TEXT NOT NULL, bytes INTEGER, filename TEXT, '
+                               'last_access REAL NOT NULL, PRIMARY KEY (account, sha256, purpose))')
+            connection.execute('CREATE INDEX IF NOT EXISTS files_file_id ON files (file_id)')
+        finally:
+            connection.close()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=FILE_INDEX_DB_TIMEOUT, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        return connection
+
+    def get(self, account, sha256, purpose):
+        try:
+            return self._get(account, sha256, purpose)
+        except (sqlite3.Error, OSError) as err:
+            logger.warning('File index could not be read, the file is uploaded without deduplication: {0}'.format(err))
+            return None
+
+    def _get(self, account, sha256, purpose):
+        connection = self._connect()
+        try:
+            row = connection.execute('SELECT file_id FROM files WHERE account = ? AND sha256 = ? AND purpose = ?',
+                                     (account, sha256, purpose)).fetchone()
+            if row is None:
+                return None
+            connection.execute('UPDATE files SET last_access = ? WHERE account = ? AND sha256 = ? AND purpose = ?',
+                               (time.time(), account, sha256, purpose))
+            return row[0]
+        finally:
+            connection.close()
+
+    def set(self, account, sha256, purpose, file_object):
+        try:
+            self._set(account, sha256, purpose, file_object)
+        except (sqlite3.Error, OSError) as err:
+            logger.warning('File {0} could not be added to the file index: {1}'.format(file_object['id'], err))
+
+    def _set(self, account, sha256, purpose, file_object):
+        connection = self._connect()
+        try:
+            # a BEGIN that fails, e.g. on a locked database, opens no transaction and is reported as is
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                connection.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                   (account, sha256, purpose, file_object['id'], file_object.get('bytes'),
+                                    file_object.get('filename'), time.time()))
+                # forget the least recently used files beyond the bound, they are uploaded again when needed
+                connection.execute('DELETE FROM files WHERE rowid IN (SELECT rowid FROM files ORDER BY last_access '
+                                   'DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+                connection.execute('COMMIT')
+            except Exception:
+                if connection.in_transaction:
+                    connection.execute('ROLLBACK')
+                raise
+        finally:
+            connection.close()
+
+    def discard_file(self, file_id):
+        try:
+            connection = self._connect()
+            try:
+                connection.execute('DELETE FROM files WHERE file_id = ?', (file_id,))
+            finally:
+                connection.close()
+        except (sqlite3.Error, OSError) as err:
+            logger.warning('File {0} could not be removed from the file index: {1}'.format(file_id, err))
+
+
+_file_index = None
+_file_index_lock = threading.Lock()
+
+
+def get_file_index():
+    global _file_index
+    with _file_index_lock:
+        if _file_index is None:
+            try:
+                _file_index = FileIndex()
+            except (sqlite3.Error, OSError) as err:
+                # created again on the next upload, the index may become available
+                logger.warning('File index is not available, files are uploaded without deduplication: '
+                               '{0}'.format(err))
+                return None
+        return _file_index
+
+
+_content_locks = weakref.WeakValueDictionary()
+
+
+def get_content_lock(*key):
+    ''' lock held while a content is looked up and uploaded, so that identical files uploaded at the same time by
+    the threads of the process are uploaded once '''
+    with _file_index_lock:
+        lock = _content_locks.get(key)
+        if lock is None:
+            lock = _content_locks[key] = threading.Lock()
+        return lock
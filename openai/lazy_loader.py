@@ -0,0 +1,34 @@
+"""
+Copyright start
+MIT License
+Copyright (c) 2025 Fortinet Inc
+Copyright end
+"""
+import importlib
+import threading
+from collections.abc import Mapping
+
+
+class LazyOperations(Mapping):
+    ''' operation name to handler mapping that imports the module of a handler the first time it is looked up, so
+    loading the connector does not import the dependencies of every operation '''
+
+    def __init__(self, operations):
+        self._operations = operations
+        self._handlers = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, operation):
+        handler = self._handlers.get(operation)
+        if handler is None:
+            module_name, function_name = self._operations[operation].rsplit('.', 1)
+            with self._lock:
+                module = importlib.import_module('.{0}'.format(module_name), __package__)
+                handler = self._handlers[operation] = getattr(module, function_name)
+        return handler
+
+    def __iter__(self):
+        return iter(self._operations)
+
+    def __len__(self):
+        return len(self._operations)
@@ -5,18 +5,24 @@ Copyright (c) 2025 Fortinet Inc
 Copyright end
 """
 import json
-import openai
-import arrow
 import re
-from bs4 import BeautifulSoup
-from jsonschema import validate
+from contextlib import contextmanager
 from connectors.core.connector import get_logger, ConnectorError
 from .constants import *
-import tiktoken
-import requests
-import httpx
+from .client_pool import get_client, get_rate_limiter, get_retry_policy
+from .response_cache import get_response_cache, build_cache_key
+from .retry import in_current_context
+from .validation import get_validator
+from .tokenizer import get_encoding, count_text_tokens, count_message_tokens, get_context_window, fit_messages
+from .uploads import upload_file_in_parts
+from .speech import synthesize_speech
+from .transcription import transcribe_in_segments
+from .file_index import get_file_index, get_account_key, get_content_lock, hash_file
 import os
+import time
+import uuid
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from connectors.cyops_utilities.files import save_file_in_env, download_file_from_cyops
 
 
@@ -26,18 +32,33 @@ logger = get_logger(LOGGER_NAME)
 # logger.setLevel(logging.DEBUG)
 
 
-def _validate_json_schema(_instance, _schema):
-    try:
-        validate(instance=_instance, schema=_schema)
-        return _instance
-    except Exception as err:
+def _validate_json_schema(_instance, _schema, name='messages'):
+    err = get_validator(_schema, name).first_error(_instance)
+    if err:
         logger.error("Error: {0} {1}".format(SCHEMA_ERROR, err))
         raise ConnectorError("Error: {0} {1}".format(SCHEMA_ERROR, err))
+    return _instance
+
+
+MENTION_PATTERN = re.compile(r'@\w+\s')
 
 
 def _remove_html_tags(text):
-    tag_stripped = BeautifulSoup(text, "html.parser").text
-    return re.sub(r'@\w+\s', '', tag_stripped)
+    # text without tags or character references comes out of the parser unchanged, except for whitespace only text
+    # that the parser collapses, so most plain messages skip building the parse tree
+    if isinstance(text, str) and '<' not in text and '&' not in text and text.strip(HTML_ASCII_SPACES):
+        tag_stripped = text
+    else:
+        from bs4 import BeautifulSoup
+        tag_stripped = BeautifulSoup(text, "html.parser").text
+    return MENTION_PATTERN.sub('', tag_stripped)
+
+
+def _remove_content_html_tags(content):
+    if isinstance(content, list):
+        return [dict(part, text=_remove_html_tags(part['text']))
+                if isinstance(part, dict) and isinstance(part.get('text'), str) else part for part in content]
+    return _remove_html_tags(content) if isinstance(content, str) else content
 
 
 def _build_messages(params):
@@ -54,43 +75,14 @@ def _build_messages(params):
     elif operation == 'chat_conversation':
         replies = _validate_json_schema(params.get('messages'), MESSAGES_SCHEMA)
         for message in replies:
-            message.update({'content': _remove_html_tags(message['content'])})
+            if 'content' in message:
+                message.update({'content': _remove_content_html_tags(message['content'])})
         messages = messages + replies
     return messages
 
 
-def __init_openai(config):
-    openai.api_key = config.get('apiKey')
-    openai_args = {"api_key": config.get('apiKey')}
-    api_type = config.get("api_type")
-    https_proxy = os.environ.get('HTTPS_PROXY')
-    no_proxy = os.environ.get('NO_PROXY', 'localhost')
-    base_url = 'api.openai.com'
-    if api_type:
-        openai.api_type = "azure"
-        openai.base_url = config.get("api_base")
-        openai.api_version = config.get("api_version")
-        openai_args.update({
-            "base_url": config.get("api_base"),
-            "api_type": "azure",
-            "api_version": config.get("api_version")
-        })
-        base_url = config.get("api_base")
-    if config.get('project'):
-        openai.project = config.get('project')
-    if config.get('organization'):
-        openai.organization = config.get('organization')
-    verify_ssl = config.get('verify_ssl')
-    if https_proxy and base_url not in no_proxy:
-        openai.http_client = httpx.Client(proxy=https_proxy, verify=verify_ssl)
-    else:
-        openai.http_client = httpx.Client(verify=verify_ssl)
-    openai_args['http_client'] = openai.http_client
-    return openai_args
-
-
-def chat_completions(config, params):
-    __init_openai(config)
+def build_chat_args(config, params):
+    ''' builds the chat completions request arguments from the action parameters '''
     model = params.get('model')
     if not model:
         model = 'gpt-3.5-turbo'
@@ -102,7 +94,8 @@ def chat_completions(config, params):
     openai_args = {"model": model, "messages": messages}
     other_fields = params.get('other_fields', {})
     if config.get("deployment_id"):
-        openai_args.update({"deployment_id": config.get("deployment_id")})
+        # Azure routes the request to the deployment named by the model
+        openai_args.update({"model": config.get("deployment_id")})
     if temperature:
         openai_args.update({"temperature": temperature})
     if max_tokens:
@@ -112,15 +105,181 @@ def chat_completions(config, params):
     if other_fields:
         openai_args.update(other_fields)
     openai_args['timeout'] = params.get('timeout') if params.get('timeout') else 600
-    return openai.chat.completions.create(**openai_args).model_dump()
+    return openai_args
+
+
+class ChatCompletionAccumulator:
+    ''' assembles streamed chat completion chunks into the same response as a non-streaming request '''
+
+    def __init__(self, sink=None):
+        self.sink = sink
+        self.completion = {'object': 'chat.completion', 'usage': None}
+        self.choices = {}
+
+    def _get_choice(self, index):
+        if index not in self.choices:
+            self.choices[index] = {
+                'index': index, 'finish_reason': None, 'logprobs': None,
+                'message': {'role': 'assistant', 'content': None, 'refusal': None, 'tool_calls': None,
+                            'function_call': None}
+            }
+        return self.choices[index]
+
+    def add(self, chunk):
+        chunk = chunk.model_dump()
+        for key in ['id', 'created', 'model', 'system_fingerprint', 'service_tier']:
+            if chunk.get(key) is not None:
+                self.completion[key] = chunk[key]
+        if chunk.get('usage'):
+            self.completion['usage'] = chunk['usage']
+        for chunk_choice in chunk.get('choices') or []:
+            choice = self._get_choice(chunk_choice['index'])
+            message, delta = choice['message'], chunk_choice.get('delta') or {}
+            if delta.get('role'):
+                message['role'] = delta['role']
+            for key in ['content', 'refusal']:
+                if delta.get(key):
+                    message[key] = (message[key] or '') + delta[key]
+            if delta.get('content') and self.sink:
+                self.sink(choice['index'], delta['content'])
+            if delta.get('function_call'):
+                function_call = message['function_call'] = message['function_call'] or {'name': '', 'arguments': ''}
+                function_call['name'] += delta['function_call'].get('name') or ''
+                function_call['arguments'] += delta['function_call'].get('arguments') or ''
+            for tool_call_delta in delta.get('tool_calls') or []:
+                tool_calls = message['tool_calls'] = message['tool_calls'] or []
+                while len(tool_calls) <= tool_call_delta['index']:
+                    tool_calls.append({'id': None, 'type': 'function', 'function': {'name': '', 'arguments': ''}})
+                tool_call = tool_calls[tool_call_delta['index']]
+                if tool_call_delta.get('id'):
+                    tool_call['id'] = tool_call_delta['id']
+                function = tool_call_delta.get('function') or {}
+                tool_call['function']['name'] += function.get('name') or ''
+                tool_call['function']['arguments'] += function.get('arguments') or ''
+            if chunk_choice.get('logprobs'):
+                logprobs = choice['logprobs'] = choice['logprobs'] or {'content': None, 'refusal': None}
+                for key in ['content', 'refusal']:
+                    if chunk_choice['logprobs'].get(key):
+                        logprobs[key] = (logprobs[key] or []) + chunk_choice['logprobs'][key]
+            if chunk_choice.get('finish_reason'):
+                choice['finish_reason'] = chunk_choice['finish_reason']
+
+    def result(self):
+        from openai.types.chat import ChatCompletion
+        completion = dict(self.completion, choices=[self.choices[index] for index in sorted(self.choices)])
+        return ChatCompletion.model_validate(completion).model_dump()
+
+
+def build_stream_args(openai_args):
+    openai_args = dict(openai_args, stream=True)
+    # the usage is only reported in the last chunk of the stream when requested
+    openai_args['stream_options'] = dict(openai_args.get('stream_options') or {}, include_usage=True)
+    return openai_args
+
+
+def _open_stream_file(file_path, env):
+    if not file_path.startswith('/tmp/'):
+        file_path = '/tmp/{0}'.format(file_path)
+    save_file_in_env(env, file_path)
+    return open(file_path, 'w', encoding='utf-8')
+
+
+@contextmanager
+def open_stream_sink(params, **kwargs):
+    ''' sink of the streamed content, written to the stream file and passed to the stream callback as it arrives '''
+    stream_callback = kwargs.get('stream_callback')
+    stream_file = _open_stream_file(params['stream_file_path'], kwargs.get('env', {})) \
+        if params.get('stream_file_path') else None
+
+    def sink(index, content):
+        if stream_file:
+            stream_file.write(content)
+            stream_file.flush()
+        if stream_callback:
+            stream_callback(index, content)
+
+    try:
+        yield sink
+    finally:
+        if stream_file:
+            stream_file.close()
+
+
+def get_cached_completion(config, params, openai_args):
+    ''' looks the request up in the opted-in response cache, returns the cache, the request key and the response '''
+    cache = get_response_cache(params.get('response_cache'))
+    if cache is None:
+        return None, None, None
+    key = build_cache_key(config, openai_args)
+    response = cache.get(key)
+    if response is not None:
+        response['cache_metadata'] = dict(cache.stats(), hit=True)
+    return cache, key, response
+
+
+def cache_completion(cache, key, params, response):
+    cache.set(key, response, params.get('cache_ttl') or RESPONSE_CACHE_DEFAULT_TTL)
+    return dict(response, cache_metadata=dict(cache.stats(), hit=False))
+
+
+def fit_chat_context(config, params, openai_args):
+    ''' pre-flight check of the conversation against the context window of the model, drops the oldest turns that
+    do not fit and returns the report of what was dropped '''
+    if params.get('operation') != 'chat_conversation' or not params.get('fit_context_window'):
+        return None
+    model = params.get('model') or openai_args['model']
+    context_window = params.get('context_window') or get_context_window(model)
+    if not context_window:
+        logger.warning('Context window of model {0} is unknown, the conversation is sent as is'.format(model))
+        return {'fitted': False, 'reason': 'Context window of model {0} is unknown'.format(model)}
+    completion_tokens = openai_args.get('max_completion_tokens') or openai_args.get('max_tokens') or \
+        CONTEXT_FIT_DEFAULT_COMPLETION_TOKENS
+    try:
+        encoding = get_encoding(model, config)
+    except ConnectorError as err:
+        logger.warning('Tokenizer is not available, the conversation is sent as is: {0}'.format(err))
+        return {'fitted': False, 'reason': str(err)}
+    budget = int(context_window) - int(completion_tokens) - CONTEXT_FIT_SAFETY_MARGIN
+    if budget <= 0:
+        raise ConnectorError('Max Tokens {0} leaves no room for the prompt in the context window of {1} tokens of '
+                             'model {2}.'.format(completion_tokens, context_window, model))
+    openai_args['messages'], report = fit_messages(encoding, openai_args['messages'], model, budget)
+    if report['dropped_messages']:
+        logger.info('Dropped {0} messages ({1} tokens) to fit the context window of model {2}'.format(
+            report['dropped_messages'], report['dropped_tokens'], model))
+    return dict(report, fitted=True, context_window=int(context_window))
+
+
+def create_chat_completion(config, params, openai_args, **kwargs):
+    if not (params.get('stream') or openai_args.pop('stream', False)):
+        cache, key, response = get_cached_completion(config, params, openai_args)
+        if response is not None:
+            return response
+        response = get_client(config).chat.completions.create(**openai_args).model_dump()
+        return cache_completion(cache, key, params, response) if cache else response
+    with open_stream_sink(params, **kwargs) as sink:
+        accumulator = ChatCompletionAccumulator(sink)
+        with get_client(config).chat.completions.create(**build_stream_args(openai_args)) as stream:
+            for chunk in stream:
+                accumulator.add(chunk)
+    return accumulator.result()
+
+
+def chat_completions(config, params, *args, **kwargs):
+    openai_args = build_chat_args(config, params)
+    context_fit = fit_chat_context(config, params, openai_args)
+    response = create_chat_completion(config, params, openai_args, **kwargs)
+    if context_fit:
+        response['context_fit'] = context_fit
+    return response
 
 
 def list_models(config, params):
-    __init_openai(config)
-    return openai.models.list().model_dump()
+    return get_client(config).models.list().model_dump()
 
 
 def get_usage(config, params):
+    import arrow
     date = arrow.get(params.get('date', arrow.now().int_timestamp)).format('YYYY-MM-DD')
     query_param = {'date': date}
     api_type = config.get("api_type")
@@ -137,13 +296,35 @@ def get_usage(config, params):
     return response
 
 
+def _load_json_list(value, name):
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            raise ConnectorError('{0} must be a JSON list.'.format(name))
+    if not isinstance(value, list):
+        raise ConnectorError('{0} must be a list.'.format(name))
+    return value
+
+
 def count_tokens(config, params):
-    """Returns the number of tokens in a text string."""
-    input_text = params.get("input_text")
+    """Returns the number of tokens in a text string, a list of texts or the messages of a chat conversation."""
     model = params.get("model")
-    encoding = tiktoken.encoding_for_model(model)
-    num_tokens = len(encoding.encode(input_text))
-    return {"tokens": num_tokens}
+    input_type = params.get("input_type") or "Text"
+    encoding = get_encoding(model, config)
+    start = time.perf_counter()
+    if input_type == "Chat Messages":
+        messages = _validate_json_schema(_load_json_list(params.get("messages"), "Messages"), MESSAGES_SCHEMA)
+        items, num_tokens = count_message_tokens(encoding, messages, model)
+    elif input_type == "List of Texts" or isinstance(params.get("input_text"), list):
+        texts = _load_json_list(params.get("input_texts") or params.get("input_text"), "Input Texts")
+        items = count_text_tokens(encoding, [str(text) for text in texts])
+        num_tokens = sum(items)
+    else:
+        # the same encoder as the lists and messages, special tokens in the text count as plain text
+        return {"tokens": count_text_tokens(encoding, [str(params.get("input_text") or "")])[0],
+                "time_taken": round(time.perf_counter() - start, 6)}
+    return {"tokens": num_tokens, "items": items, "time_taken": round(time.perf_counter() - start, 6)}
 
 
 def check(config):
@@ -165,6 +346,7 @@ def check(config):
 
 
 def make_rest_call(config, url, method='GET', **kwargs):
+    import requests
     try:
         headers = {
             "Authorization": "Bearer {0}".format(config.get('apiKey'))
@@ -176,7 +358,15 @@ def make_rest_call(config, url, method='GET', **kwargs):
             make_curl(method=method, url=url, headers=debug_headers, **kwargs)
         except Exception as err:
             logger.info("Error: {0}".format(err))
-        response = requests.request(method=method, url=url, headers=headers, **kwargs)
+        rate_limiter = get_rate_limiter(config)
+
+        def send_request():
+            rate_limiter.acquire()
+            response = requests.request(method=method, url=url, headers=headers, **kwargs)
+            rate_limiter.update_from_headers(response.headers)
+            return response
+
+        response = get_retry_policy(config).call(send_request)
         if response.ok:
             return response.json()
         else:
@@ -217,276 +407,392 @@ def build_payload(params: dict):
     return data
 
 
-def create_assistant(config, params):
-    __init_openai(config)
+def build_request_payload(params):
     payload = build_payload(params)
     payload['timeout'] = params.get('timeout') if params.get('timeout') else 600
-    client = openai.OpenAI(api_key=openai.api_key, organization=openai.organization, project=openai.project, http_client=openai.http_client)
-    return client.beta.assistants.create(**payload).model_dump()
+    return payload
 
 
-def list_assistants(config, params):
-    __init_openai(config)
+def build_list_payload(params):
     params['order'] = SORT_ORDER_MAPPING.get(params.get('order'))
-    payload = build_payload(params)
-    payload['timeout'] = params.get('timeout') if params.get('timeout') else 600
+    payload = build_request_payload(params)
     limit = params.get('limit')
     # Maximum limit supported by API is 100
     if limit and isinstance(limit, int) and limit > 100:
         payload['limit'] = 100
-    client = openai.OpenAI(api_key=openai.api_key, organization=openai.organization, project=openai.project, http_client=openai.http_client)
-    return client.beta.assistants.list(**payload).model_dump()
+    return payload
+
+
+def build_run_payload(params):
+    other_fields = params.pop('other_fields', {})
+    payload = build_request_payload(params)
+    if other_fields:
+        payload.update(other_fields)
+    return payload
+
+
+def build_thread_message_payload(params):
+    params['role'] = params.get('role', '').lower()
+    contents = params.get('content')
+    if isinstance(contents, list):
+        for content in contents:
+            c_text, c_type = content.get('text'), content.get('type')
+            if isinstance(content, dict) and c_type == 'text' and c_text and isinstance(c_text, int):
+                content['text'] = str(c_text)
+    elif not isinstance(contents, str):
+        params['content'] = str(contents)
+    return build_request_payload(params)
+
+
+def build_vector_store_payload(params):
+    handle_comma_separated_input(params, ['file_ids'])
+    return build_request_payload(params)
+
+
+def build_file_batch_payload(params):
+    file_ids = params.get('file_ids')
+    if isinstance(file_ids, (tuple, list)):
+        params['file_ids'] = list(file_ids)
+    elif isinstance(file_ids, str):
+        params['file_ids'] = [file_id.strip() if isinstance(file_id, str) else file_id for file_id in file_ids.split(",")]
+    return build_request_payload(params)
+
+
+def build_list_files_payload(params):
+    params['purpose'] = FILE_PURPOSE_MAPPING.get(params.get('purpose'))
+    return build_request_payload(params)
+
+
+def create_assistant(config, params):
+    payload = build_request_payload(params)
+    return get_client(config).beta.assistants.create(**payload).model_dump()
+
+
+def list_assistants(config, params):
+    payload = build_list_payload(params)
+    return get_client(config).beta.assistants.list(**payload).model_dump()
 
 
 def get_assistant(config, params):
-    __init_openai(config)
-    client = openai.OpenAI(api_key=openai.api_key, organization=openai.organization, project=openai.project, http_client=openai.http_client)
-    return client.beta.assistants.retrieve(assistant_id=params.get('assistant_id'), timeout=600).model_dump()
+    payload = build_request_payload(params)
+    return get_client(config).beta.assistants.retrieve(**payload).model_dump()
 
 
 def delete_assistant(config, params):
-    __init_openai(config)
-    client = openai.OpenAI(api_key=openai.api_key, organization=openai.organization, project=openai.project, http_client=openai.http_client)
-    return client.beta.assistants.delete(assistant_id=params.get('assistant_id'), timeout=600).model_dump()
+    payload = build_request_payload(params)
+    return get_client(config).beta.assistants.delete(**payload).model_dump()
 
 
 def update_assistant(config, params):
-    __init_openai(config)
-    payload = build_payload(params)
-    payload['timeout'] = params.get('timeout') if params.get('timeout') else 600
-    client = openai.OpenAI(api_key=openai.api_key, organization=openai.organization, project=openai.project, http_client=openai.http_client)
-    return client.beta.assistants.update(**payload).model_dump()
+    payload = build_request_payload(params)
+    return get_client(config).beta.assistants.update(**payload).model_dump()
 
 
 def get_thread(config, params):
-    __init_openai(config)
-    params['timeout'] = params.get('timeout') if params.get('timeout') else 600
-    client = openai.OpenAI(api_key=openai.api_key, organization=openai.organization, project=openai.project, http_client=openai.http_client)
-    return client.beta.threads.retrieve(**params).model_dump()
+    payload = build_request_payload(params)
+    return get_client(config).beta.threads.retrieve(**payload).model_dump()
 
 
 def delete_thread(config, params):
-    __init_openai(config)
-    params['timeout'] = params.get('timeout') if params.get('timeout') else 600
-    client = openai.OpenAI(api_key=openai.api_key, organization=openai.organization, project=openai.project, http_client=openai.http_client)
-    return client.beta.threads.delete(**params).model_dump()
+    payload = build_request_payload(params)
+    return get_client(config).beta.threads.delete(**payload).model_dump()
 
 
 def create_thread(config, params):
-    __init_openai(config)
-    payload = build_payload(params)
-    payload['timeout'] = params.get('timeout') if params.get('timeout') else 600
-    client = openai.OpenAI(api_key=openai.api_key, organization=openai.organization, project=openai.project, http_client=openai.http_client)
-    return client.beta.threads.create(**payload).model_dump()
+    payload = build_request_payload(params)
+    return get_client(config).beta.threads.create(**payload).model_dump()
 
 
 def update_thread(config, params):
-    __init_openai(config)
-    payload = build_payload(params)
-    payload['timeout'] = params.get('timeout') if params.get('timeout') else 600
-    client = openai.OpenAI(api_key=openai.api_key, organization=openai.organization, project=openai.project, http_client=openai.http_client)
-    return client.beta.threads.update(**payload).model_dump()
+    payload = build_request_payload(params)
+    return get_client(config).beta.threads.update(**payload).model_dump()
 
 
 def create_thread_message(config, params):
-    __init_openai(config)
-    params['role'] = params.get('role', '').lower()
-    contents = params.get('content')
-    if isinstance(contents, list):
-        for content in contents:
-            c_text, c_type = content.get('text'), content.get('type')
-            if isinstance(content, dict) and c_type == 'text' and c_text and isinstance(c_text, int):
-                content['text'] = str(c_text)
-    elif not isinstance(contents, str):
-        params['content'] = str(contents)
-    payload = build_payload(params)
-    payload['timeout'] = params.get('timeout') if params.get('timeout') else 600
-    client = openai.OpenAI(api_key=openai.api_key, organization=openai.organization, project=openai.project, http_client=openai.http_client)
-    return client.beta.threads.messages.create(**payload).model_dump()
+    payload = build_thread_message_payload(params)
+    return get_client(config).beta.threads.messages.create(**payload).model_dump()
 
 
 def list_thread_messages(config, params):
-    __init_openai(config)
-    params['order'] = SORT_ORDER_MAPPING.get(params.get('order'))
-    limit = params.get('limit')
-    # Maximum limit supported by API is 100
-    if limit and isinstance(limit, int) and limit > 100:
-        params['limit'] = 100
-    payload = build_payload(params)
-    payload['timeout'] = params.get('timeout') if params.get('timeout') else 600
-    client = openai.OpenAI(api_key=openai.api_key, organization=openai.organization, project=openai.project, http_client=openai.http_client)
-    return client.beta.threads.messages.list(**payload).model_dump()
+    payload = build_list_payload(params)
+    return get_client(config).beta.threads.messages.list(**payload).model_dump()
 
 
 def delete_thread_message(config, params):
-    __init_openai(config)
-    payload = build_payload(params)
-    payload['timeout'] = params.get('timeout') if params.get('timeout') else 600
-    client = openai.OpenAI(api_key=openai.api_key, organization=openai.organization, project=openai.project, http_client=openai.http_client)
-    return client.beta.threads.messages.delete(**payload).model_dump()
+    payload = build_request_payload(params)
+    return get_client(config).beta.threads.messages.delete(**payload).model_dump()
 
 
 def get_thread_message(config, params):
-    __init_openai(config)
-    payload = build_payload(params)
-    payload['timeout'] = params.get('timeout') if params.get('timeout') else 600
-    client = openai.OpenAI(api_key=openai.api_key, organization=openai.organization, project=openai.project, http_client=openai.http_client)
-    return client.beta.threads.messages.retrieve(**payload).model_dump()
+    payload = build_request_payload(params)
+    return get_client(config).beta.threads.messages.retrieve(**payload).model_dump()
 
 
 def update_thread_message(config, params):
-    __init_openai(config)
-    payload = build_payload(params)
-    payload['timeout'] = params.get('timeout') if params.get('timeout') else 600
-    client = openai.OpenAI(api_key=openai.api_key, organization=openai.organization, project=openai.project, http_client=openai.http_client)
-    return client.beta.threads.messages.update(**payload).model_dump()
+    payload = build_request_payload(params)
+    return get_client(config).beta.threads.messages.update(**payload).model_dump()
 
 
 def list_runs(config, params):
-    __init_openai(config)
-    params['order'] = SORT_ORDER_MAPPING.get(params.get('order'))
-    payload = build_payload(params)
-    payload['timeout'] = params.get('timeout') if params.get('timeout') else 600
-    limit = params.get('limit')
-    # Maximum limit supported by API is 100
-    if limit and isinstance(limit, int) and limit > 100:
-        payload['limit'] = 100
-    client = openai.OpenAI(api_key=openai.api_key, organization=openai.organization, project=openai.project, http_client=openai.http_client)
-    return client.beta.threads.runs.list(**payload).model_dump()
+    payload = build_list_payload(params)
+    return get_client(config).beta.threads.runs.list(**payload).model_dump()
 
 
 def get_run(config, params):
-    __init_openai(config)
-    payload = build_payload(params)
-    payload['timeout'] = params.get('timeout') if params.get('timeout') else 600
-    client = openai.OpenAI(api_key=openai.api_key, organization=openai.organization, project=openai.project, http_client=openai.http_client)
-    return client.beta.threads.runs.retrieve(**payload).model_dump()
+    payload = build_request_payload(params)
+    return get_client(config).beta.threads.runs.retrieve(**payload).model_dump()
+
+
+def wait_for_run(config, params, run_object=None):
+    ''' waits for the run to reach a terminal status, polling with adaptive backoff until the wait timeout;
+    returns the run and the number of polls and the time spent waiting '''
+    run_payload = {'run_id': params['run_id'], 'thread_id': params['thread_id']}
+    wait_timeout = params.get('wait_timeout') or RUN_WAIT_TIMEOUT
+    interval = RUN_POLL_INITIAL_INTERVAL
+    start = time.monotonic()
+    polls = 0
+    while run_object is None or run_object['status'] not in RUN_TERMINAL_STATUSES:
+        if polls:
+            remaining = wait_timeout - (time.monotonic() - start)
+            if remaining <= 0:
+                raise ConnectorError('Run {0} did not complete within {1} seconds, last status: {2}'.format(
+                    params['run_id'], wait_timeout, run_object['status']))
+            time.sleep(min(interval, remaining))
+            interval = min(interval * RUN_POLL_BACKOFF_FACTOR, RUN_POLL_MAX_INTERVAL)
+        run_object = get_run(config, dict(run_payload))
+        polls += 1
+    return run_object, {'polls': polls, 'wait_time': round(time.monotonic() - start, 3)}
 
 
 def create_run(config, params):
-    __init_openai(config)
-    payload = build_payload(params)
-    other_fields = params.pop('other_fields', {})
-    if other_fields:
-        payload.update(other_fields)
-    payload['timeout'] = params.get('timeout') if params.get('timeout') else 600
-    client = openai.OpenAI(api_key=openai.api_key, organization=openai.organization, project=openai.project, http_client=openai.http_client)
-    return client.beta.threads.runs.create(**payload).model_dump()
+    payload = build_run_payload(params)
+    return get_client(config).beta.threads.runs.create(**payload).model_dump()
 
 
 def update_run(config, params):
-    __init_openai(config)
-    payload = build_payload(params)
-    payload['timeout'] = params.get('timeout') if params.get('timeout') else 600
-    client = openai.OpenAI(api_key=openai.api_key, organization=openai.organization, project=openai.project, http_client=openai.http_client)
-    return client.beta.threads.runs.update(**payload).model_dump()
+    payload = build_request_payload(params)
+    return get_client(config).beta.threads.runs.update(**payload).model_dump()
 
 
 def cancel_run(config, params):
-    __init_openai(config)
-    payload = build_payload(params)
-    payload['timeout'] = params.get('timeout') if params.get('timeout') else 600
-    client = openai.OpenAI(api_key=openai.api_key, organization=openai.organization, project=openai.project, http_client=openai.http_client)
-    return client.beta.threads.runs.cancel(**payload).model_dump()
+    payload = build_request_payload(params)
+    return get_client(config).beta.threads.runs.cancel(**payload).model_dump()
 
 
 def create_thread_and_run(config, params):
-    __init_openai(config)
-    payload = build_payload(params)
-    other_fields = params.pop('other_fields', {})
-    if other_fields:
-        payload.update(other_fields)
-    payload['timeout'] = params.get('timeout') if params.get('timeout') else 600
-    client = openai.OpenAI(api_key=openai.api_key, organization=openai.organization, project=openai.project, http_client=openai.http_client)
-    return client.beta.threads.create_and_run(**payload).model_dump()
+    payload = build_run_payload(params)
+    return get_client(config).beta.threads.create_and_run(**payload).model_dump()
 
 
 def submit_tool_outputs_to_run(config, params):
-    __init_openai(config)
-    payload = build_payload(params)
-    payload['timeout'] = params.get('timeout') if params.get('timeout') else 600
-    client = openai.OpenAI(api_key=openai.api_key, organization=openai.organization, project=openai.project, http_client=openai.http_client)
-    return client.beta.threads.runs.submit_tool_outputs(**payload).model_dump()
+    payload = build_request_payload(params)
+    return get_client(config).beta.threads.runs.submit_tool_outputs(**payload).model_dump()
 
 
 def list_run_steps(config, params):
-    __init_openai(config)
-    params['order'] = SORT_ORDER_MAPPING.get(params.get('order'))
-    payload = build_payload(params)
-    payload['timeout'] = params.get('timeout') if params.get('timeout') else 600
-    limit = params.get('limit')
-    # Maximum limit supported by API is 100
-    if limit and isinstance(limit, int) and limit > 100:
-        payload['limit'] = 100
-    client = openai.OpenAI(api_key=openai.api_key, organization=openai.organization, project=openai.project, http_client=openai.http_client)
-    return client.beta.threads.runs.steps.list(**payload).model_dump()
+    payload = build_list_payload(params)
+    return get_client(config).beta.threads.runs.steps.list(**payload).model_dump()
 
 
 def get_run_step(config, params):
-    __init_openai(config)
-    payload = build_payload(params)
-    payload['timeout'] = params.get('timeout') if params.get('timeout') else 600
-    client = openai.OpenAI(api_key=openai.api_key, organization=openai.organization, project=openai.project, http_client=openai.http_client)
-    return client.beta.threads.runs.steps.retrieve(**payload).model_dump()
+    payload = build_request_payload(params)
+    return get_client(config).beta.threads.runs.steps.retrieve(**payload).model_dump()
 
 
 def create_vector_store(config, params):
-    __init_openai(config)
-    handle_comma_separated_input(params, ['file_ids'])
-    payload = build_payload(params)
-    payload['timeout'] = params.get('timeout') if params.get('timeout') else 600
-    client = openai.OpenAI(api_key=openai.api_key, organization=openai.organization, project=openai.project, http_client=openai.http_client)
-    return client.beta.vector_stores.create(**payload).model_dump()
+    payload = build_vector_store_payload(params)
+    return get_client(config).beta.vector_stores.create(**payload).model_dump()
 
 
 def get_vector_store(config, params):
-    __init_openai(config)
-    payload = build_payload(params)
-    payload['timeout'] = params.get('timeout') if params.get('timeout') else 600
-    client = openai.OpenAI(api_key=openai.api_key, organization=openai.organization, project=openai.project, http_client=openai.http_client)
-    return client.beta.vector_stores.retrieve(**payload).model_dump()
-
-
-def create_vector_store_file(config, params):
-    __init_openai(config)
-    payload = build_payload(params)
-    payload['timeout'] = params.get('timeout') if params.get('timeout') else 600
-    client = openai.OpenAI(api_key=openai.api_key, organization=openai.organization, project=openai.project, http_client=openai.http_client)
-    return client.beta.vector_stores.files.create(**payload).model_dump()
-
-
-def create_vector_store_file_batch(config, params):
-    __init_openai(config)
-    file_ids = params.get('file_ids')
-    if isinstance(file_ids, (tuple, list)):
-        params['file_ids'] = list(file_ids)
-    elif isinstance(file_ids, str):
-        params['file_ids'] = [file_id.strip() if isinstance(file_id, str) else file_id for file_id in file_ids.split(",")]
-    payload = build_payload(params)
-    payload['timeout'] = params.get('timeout') if params.get('timeout') else 600
-    client = openai.OpenAI(api_key=openai.api_key, organization=openai.organization, project=openai.project, http_client=openai.http_client)
-    return client.beta.vector_stores.file_batches.create(**payload).model_dump()
+    payload = build_request_payload(params)
+    return get_client(config).beta.vector_stores.retrieve(**payload).model_dump()
+
+
+def upload_vector_store_files(config, files, env={}):
+    ''' uploads the files given by IRI or path for the assistants, content uploaded before is reused; returns the
+    file ids '''
+    return [upload_file(config, {'file': file, 'purpose': 'Assistants', 'deduplicate': True}, env=env)['id']
+            for file in load_file_list(files)]
+
+
+def create_vector_store_file(config, params, *args, **kwargs):
+    file = params.pop('file', None)
+    if file and not params.get('file_id'):
+        params['file_id'] = upload_vector_store_files(config, file, kwargs.get('env', {}))[0]
+    payload = build_request_payload(params)
+    return get_client(config).beta.vector_stores.files.create(**payload).model_dump()
+
+
+def load_file_list(files):
+    if isinstance(files, str):
+        files = files.strip()
+        if files.startswith('['):
+            return json.loads(files)
+        return [files] if files else []
+    if isinstance(files, dict):
+        # a single FortiSOAR file
+        return [files]
+    return files or []
+
+
+def is_file_batch_done(batch):
+    counts = batch['file_counts']
+    return batch['status'] in FILE_BATCH_TERMINAL_STATUSES or (
+        counts['in_progress'] == 0 and counts['completed'] + counts['failed'] + counts['cancelled'] == counts['total'] > 0)
+
+
+def wait_for_file_batches(config, batches, wait_timeout=FILE_BATCH_WAIT_TIMEOUT, timeout=600):
+    ''' polls the file batches with backoff until all their files are processed or the wait timeout; the batches
+    are updated in place and keep being processed by the server after a timeout '''
+    client = get_client(config)
+    interval = FILE_BATCH_POLL_INITIAL_INTERVAL
+    start = time.monotonic()
+    polls = 0
+    pending = [index for index, batch in enumerate(batches) if not is_file_batch_done(batch)]
+    while pending:
+        remaining = wait_timeout - (time.monotonic() - start)
+        if remaining <= 0:
+            logger.warning('File batches {0} did not complete within {1} seconds'.format(
+                ', '.join(batches[index]['id'] for index in pending), wait_timeout))
+            break
+        time.sleep(min(interval, remaining))
+        interval = min(interval * FILE_BATCH_POLL_BACKOFF_FACTOR, FILE_BATCH_POLL_MAX_INTERVAL)
+        for index in pending:
+            batches[index] = client.beta.vector_stores.file_batches.retrieve(
+                batch_id=batches[index]['id'], vector_store_id=batches[index]['vector_store_id'],
+                timeout=timeout).model_dump()
+        polls += 1
+        pending = [index for index in pending if not is_file_batch_done(batches[index])]
+    return {'polls': polls, 'wait_time': round(time.monotonic() - start, 3), 'timed_out': bool(pending)}
+
+
+def create_vector_store_file_batch(config, params, *args, **kwargs):
+    files = load_file_list(params.pop('files', None))
+    wait, wait_timeout = params.pop('wait', False), params.pop('wait_timeout', None)
+    payload = build_file_batch_payload(params)
+    if files:
+        file_ids = (payload.get('file_ids') or []) + upload_vector_store_files(config, files, kwargs.get('env', {}))
+        # identical files resolve to the same uploaded file
+        payload['file_ids'] = list(dict.fromkeys(file_ids))
+    batch = get_client(config).beta.vector_stores.file_batches.create(**payload).model_dump()
+    if not wait:
+        return batch
+    batches = [batch]
+    batch_wait = wait_for_file_batches(config, batches, float(wait_timeout or FILE_BATCH_WAIT_TIMEOUT),
+                                       payload['timeout'])
+    return dict(batches[0], batch_wait=batch_wait)
+
+
+def get_batch_file_statuses(config, batches, timeout=600):
+    ''' status and last error of the files of processed batches; only the files that did not complete are listed '''
+    client = get_client(config)
+    statuses = {}
+    for batch in batches:
+        for status in ['failed', 'cancelled', 'in_progress']:
+            if not batch['file_counts'][status]:
+                continue
+            page = client.beta.vector_stores.file_batches.list_files(
+                batch['id'], vector_store_id=batch['vector_store_id'], filter=status, limit=100, timeout=timeout)
+            while True:
+                for file in page.data:
+                    statuses[file.id] = {'status': file.status,
+                                         'last_error': file.last_error.model_dump() if file.last_error else None}
+                # older SDK versions ignore has_more and request an empty page after the last one
+                if not getattr(page, 'has_more', True) or not page.has_next_page():
+                    break
+                page = page.get_next_page()
+    return statuses
+
+
+def ingest_files_to_vector_store(config, params, *args, **kwargs):
+    ''' uploads the files concurrently, adds them to the vector store in file batches of bounded size and waits
+    until the batches are processed; returns the status of each file and the ingestion throughput '''
+    env = kwargs.get('env', {})
+    files = load_file_list(params.get('files'))
+    if not files:
+        raise ConnectorError('Specify the files to ingest into the vector store.')
+    vector_store_id = params.get('vector_store_id')
+    batch_size = min(int(params.get('batch_size') or FILE_BATCH_MAX_FILES), FILE_BATCH_MAX_FILES)
+    concurrency = int(params.get('concurrency') or INGEST_UPLOAD_CONCURRENCY)
+    wait_timeout = float(params.get('wait_timeout') or FILE_BATCH_WAIT_TIMEOUT)
+    timeout = params.get('timeout') if params.get('timeout') else 600
+    start = time.monotonic()
+
+    def upload(file):
+        name = file.get('@id') if isinstance(file, dict) else file
+        try:
+            uploaded = upload_file(config, {'file': file, 'purpose': 'Assistants', 'deduplicate': True}, env=env)
+        except Exception as err:
+            # a file that cannot be uploaded is reported, the others are still ingested
+            logger.warning('Failed to upload {0} for ingestion: {1}'.format(name, err))
+            return {'file': name, 'file_id': None, 'status': 'upload_failed', 'last_error': str(err)}
+        return {'file': name, 'file_id': uploaded['id'], 'filename': uploaded.get('filename'),
+                'bytes': uploaded.get('bytes'), 'deduplicated': uploaded.get('deduplicated', False),
+                'status': 'completed', 'last_error': None}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(files))),
+                            thread_name_prefix='openai-ingest') as executor:
+        results = list(executor.map(in_current_context(upload), files))
+    upload_time = time.monotonic() - start
+    # identical files resolve to the same uploaded file, which is added once
+    file_ids = list(dict.fromkeys(result['file_id'] for result in results if result['file_id']))
+    client = get_client(config)
+    batches = [client.beta.vector_stores.file_batches.create(vector_store_id=vector_store_id,
+                                                             file_ids=file_ids[offset:offset + batch_size],
+                                                             timeout=timeout).model_dump()
+               for offset in range(0, len(file_ids), batch_size)]
+    batch_wait = wait_for_file_batches(config, batches, wait_timeout, timeout)
+    statuses = get_batch_file_statuses(config, batches, timeout)
+    for result in results:
+        if result['file_id'] in statuses:
+            result.update(statuses[result['file_id']])
+    elapsed = time.monotonic() - start
+    file_counts = {key: sum(batch['file_counts'][key] for batch in batches)
+                   for key in ['in_progress', 'completed', 'failed', 'cancelled', 'total']}
+    # throughput counts each file once, however many of the inputs have its content
+    completed = {result['file_id']: result['bytes'] or 0 for result in results if result['status'] == 'completed'}
+    ingested_bytes = sum(completed.values())
+    if batch_wait['timed_out']:
+        # the batches are still processed by the server, their files are reported as in progress
+        status = 'timeout'
+    elif all(result['status'] == 'completed' for result in results):
+        status = 'completed'
+    else:
+        status = 'completed_with_errors' if completed else 'failed'
+    logger.info('Ingested {0} of {1} files into {2} in {3:.3f}s'.format(len(completed), len(file_ids),
+                                                                         vector_store_id, elapsed))
+    return {
+        'vector_store_id': vector_store_id,
+        'status': status,
+        'file_counts': file_counts,
+        'files': results,
+        'batches': [{'id': batch['id'], 'status': batch['status'], 'file_counts': batch['file_counts']}
+                    for batch in batches],
+        'throughput': {
+            'files': len(completed),
+            'bytes': ingested_bytes,
+            'upload_time': round(upload_time, 3),
+            'processing_time': batch_wait['wait_time'],
+            'polls': batch_wait['polls'],
+            'elapsed_time': round(elapsed, 3),
+            'files_per_second': round(len(completed) / elapsed, 3) if elapsed else None,
+            'bytes_per_second': round(ingested_bytes / elapsed) if elapsed else None
+        }
+    }
 
 
 def get_vector_store_file_batch(config, params):
-    __init_openai(config)
-    payload = build_payload(params)
-    payload['timeout'] = params.get('timeout') if params.get('timeout') else 600
-    client = openai.OpenAI(api_key=openai.api_key, organization=openai.organization, project=openai.project, http_client=openai.http_client)
-    return client.beta.vector_stores.file_batches.retrieve(**payload).model_dump()
+    payload = build_request_payload(params)
+    return get_client(config).beta.vector_stores.file_batches.retrieve(**payload).model_dump()
 
 
 def cancel_vector_store_file_batch(config, params):
-    __init_openai(config)
-    payload = build_payload(params)
-    payload['timeout'] = params.get('timeout') if params.get('timeout') else 600
-    client = openai.OpenAI(api_key=openai.api_key, organization=openai.organization, project=openai.project, http_client=openai.http_client)
-    return client.beta.vector_stores.file_batches.cancel(**payload).model_dump()
+    payload = build_request_payload(params)
+    return get_client(config).beta.vector_stores.file_batches.cancel(**payload).model_dump()
 
 
-def create_speech(config, params, *args, **kwargs):
-    __init_openai(config)
-    env = kwargs.get('env', {})
+def build_speech_payload(params):
     file_path = params.pop('file_path')
     _list = file_path.split('.')
     file_format = params.get('response_format') if params.get('response_format') else 'mp3'
@@ -500,12 +806,17 @@ def create_speech(config, params, *args, **kwargs):
         speech_file_path = Path("/tmp") / file_path
     params['model'] = params.get('model', '').lower()
     params['voice'] = params.get('voice', '').lower()
-    payload = build_payload(params)
-    payload['timeout'] = params.get('timeout') if params.get('timeout') else 600
-    openai.audio.speech.create(**payload).stream_to_file(speech_file_path)
+    payload = build_request_payload(params)
+    return speech_file_path, payload
+
+
+def create_speech(config, params, *args, **kwargs):
+    env = kwargs.get('env', {})
+    speech_file_path, payload = build_speech_payload(params)
+    stats = synthesize_speech(config, payload, speech_file_path)
     return_path = str(speech_file_path)
     save_file_in_env(env, return_path)
-    return {'path': return_path}
+    return dict({'path': return_path}, **stats)
 
 
 def get_file_input(file_payload, env={}):
@@ -520,61 +831,225 @@ def get_file_input(file_payload, env={}):
         filename = Path(file_payload).name
     if not file_path.startswith('/tmp/'):
         file_path = '/tmp/{0}'.format(file_path)
-    with open(file_path, 'rb') as file:
-        file_content = file.read()
+    # the HTTP client streams the open file in chunks instead of holding all of it in memory, the caller closes it
+    file = open(file_path, 'rb')
     save_file_in_env(env, file_path)
-    return filename, file_content
+    return filename, file
 
 
-def create_transcription(config, params, *args, **kwargs):
-    __init_openai(config)
-    env = kwargs.get('env', {})
+def build_transcription_payload(params, env):
     params['voice'] = params.get('voice', '').lower()
     timestamp_granularities = [granularity.lower() for granularity in params.get('timestamp_granularities')]
     if timestamp_granularities:
         params['response_format'] = 'verbose_json'
     payload = build_payload(params)
+    for key in ('segmented', 'segment_duration', 'segment_overlap'):
+        payload.pop(key, None)
     payload['timestamp_granularities'] = timestamp_granularities
     payload['file'] = get_file_input(params.get('file'), env)
     payload['timeout'] = params.get('timeout') if params.get('timeout') else 600
-    return openai.audio.transcriptions.create(**payload).model_dump()
+    return payload
 
 
-def create_translation(config, params, *args, **kwargs):
-    __init_openai(config)
-    env = kwargs.get('env', {})
-    payload = build_payload(params)
+def create_transcription(config, params, *args, **kwargs):
+    payload = build_transcription_payload(params, kwargs.get('env', {}))
+    with payload['file'][1]:
+        if params.get('segmented'):
+            # long audio is transcribed as overlapping segments sent concurrently and stitched back together
+            return transcribe_in_segments(config, payload,
+                                          params.get('segment_duration') or TRANSCRIPTION_SEGMENT_DURATION,
+                                          params.get('segment_overlap') if params.get('segment_overlap') is not None
+                                          else TRANSCRIPTION_SEGMENT_OVERLAP)
+        return get_client(config).audio.transcriptions.create(**payload).model_dump()
+
+
+def build_translation_payload(params, env):
+    payload = build_request_payload(params)
     payload['file'] = get_file_input(params.get('file'), env)
-    payload['timeout'] = params.get('timeout') if params.get('timeout') else 600
-    return openai.audio.translations.create(**payload).model_dump()
+    return payload
+
+
+def create_translation(config, params, *args, **kwargs):
+    payload = build_translation_payload(params, kwargs.get('env', {}))
+    with payload['file'][1]:
+        return get_client(config).audio.translations.create(**payload).model_dump()
 
 
 def get_file(config, params):
-    __init_openai(config)
-    payload = build_payload(params)
-    payload['timeout'] = params.get('timeout') if params.get('timeout') else 600
-    client = openai.OpenAI(api_key=openai.api_key, organization=openai.organization, project=openai.project, http_client=openai.http_client)
-    return client.files.retrieve(**payload).model_dump()
+    from openai import NotFoundError
+    payload = build_request_payload(params)
+    try:
+        return get_client(config).files.retrieve(**payload).model_dump()
+    except NotFoundError:
+        # the file was deleted, identical content has to be uploaded again
+        file_index = get_file_index()
+        if file_index:
+            file_index.discard_file(payload.get('file_id'))
+        raise
 
 
 def list_files(config, params):
-    __init_openai(config)
-    params['purpose'] = FILE_PURPOSE_MAPPING.get(params.get('purpose'))
-    payload = build_payload(params)
-    payload['timeout'] = params.get('timeout') if params.get('timeout') else 600
-    client = openai.OpenAI(api_key=openai.api_key, organization=openai.organization, project=openai.project, http_client=openai.http_client)
-    return client.files.list(**payload).model_dump()
+    payload = build_list_files_payload(params)
+    return get_client(config).files.list(**payload).model_dump()
 
 
-def upload_file(config, params, *args, **kwargs):
-    __init_openai(config)
-    env = kwargs.get('env', {})
+def build_upload_payload(params, env):
     params['purpose'] = FILE_PURPOSE_MAPPING.get(params.get('purpose'), params.get('purpose'))
-    payload = build_payload(params)
-    payload['timeout'] = params.get('timeout') if params.get('timeout') else 600
+    payload = build_request_payload(params)
+    payload.pop('deduplicate', None)
     payload['file'] = get_file_input(params.get('file'), env)
-    client = openai.OpenAI(api_key=openai.api_key, organization=openai.organization, project=openai.project, http_client=openai.http_client)
-    return client.files.create(**payload).model_dump()
+    return payload
+
+
+def is_multipart_upload(file):
+    return os.fstat(file.fileno()).st_size > UPLOAD_MULTIPART_THRESHOLD
+
+
+def create_file(config, payload):
+    filename, file = payload['file']
+    if is_multipart_upload(file):
+        return upload_file_in_parts(config, filename, file, payload['purpose']).model_dump()
+    return get_client(config).files.create(**payload).model_dump()
+
+
+def find_uploaded_file(config, file_index, content_hash, purpose):
+    ''' the file uploaded before with the same content and purpose, checked with get_file as it may have been
+    deleted since '''
+    from openai import NotFoundError
+    file_id = file_index.get(get_account_key(config), content_hash, purpose)
+    if not file_id:
+        return None
+    try:
+        file_object = get_file(config, {'file_id': file_id})
+    except NotFoundError:
+        logger.info('File {0} uploaded with the same content no longer exists'.format(file_id))
+        return None
+    if file_object.get('status') == 'error':
+        file_index.discard_file(file_id)
+        return None
+    return file_object
+
+
+def upload_file(config, params, *args, **kwargs):
+    payload = build_upload_payload(params, kwargs.get('env', {}))
+    with payload['file'][1] as file:
+        if not params.get('deduplicate'):
+            return create_file(config, payload)
+        file_index = get_file_index()
+        if not file_index:
+            return dict(create_file(config, payload), deduplicated=False)
+        # one sequential read of the file, the upload then reads it from the page cache
+        content_hash = hash_file(file)
+        with get_content_lock(get_account_key(config), content_hash, payload['purpose']):
+            file_object = find_uploaded_file(config, file_index, content_hash, payload['purpose'])
+            if file_object:
+                logger.info('Reusing file {0} uploaded with the same content'.format(file_object['id']))
+                return dict(file_object, deduplicated=True)
+            file_object = create_file(config, payload)
+            file_index.set(get_account_key(config), content_hash, payload['purpose'], file_object)
+            return dict(file_object, deduplicated=False)
+
+
+def _build_batch_request(item, index, endpoint, model):
+    if isinstance(item, str):
+        field = BATCH_TEXT_REQUEST_FIELDS.get(endpoint)
+        # a message string is the input of embeddings and the prompt of completions
+        item = {field: item} if field else {'messages': _build_messages({'operation': 'chat_completions',
+                                                                          'message': item})}
+    if 'body' in item:
+        custom_id, body = item.get('custom_id'), dict(item['body'])
+    else:
+        body = dict(item)
+        custom_id = body.pop('custom_id', None)
+    if model and not body.get('model'):
+        body['model'] = model
+    return {'custom_id': str(custom_id) if custom_id else 'request-{0}'.format(index),
+            'method': 'POST', 'url': endpoint, 'body': body}
+
+
+def write_batch_file(requests_list, endpoint, model=None):
+    ''' writes the batch requests to a JSONL file under /tmp one line at a time '''
+    file_path = '/tmp/openai_batch_{0}.jsonl'.format(uuid.uuid4().hex)
+    custom_ids = {}
+    try:
+        with open(file_path, 'w') as batch_file:
+            for index, item in enumerate(requests_list):
+                request = _build_batch_request(item, index, endpoint, model)
+                # the results are matched to the requests by custom ID, including the generated request-<index>
+                if request['custom_id'] in custom_ids:
+                    raise ConnectorError('Requests {0} and {1} have the same custom ID {2}, each request of a batch '
+                                         'needs a unique custom ID.'.format(custom_ids[request['custom_id']], index,
+                                                                            request['custom_id']))
+                custom_ids[request['custom_id']] = index
+                batch_file.write(json.dumps(request))
+                batch_file.write('\n')
+    except Exception:
+        os.remove(file_path)
+        raise
+    return file_path
+
+
+def create_batch(config, params, *args, **kwargs):
+    requests_list = params.get('requests') or []
+    if isinstance(requests_list, str):
+        requests_list = json.loads(requests_list)
+    endpoint = params.get('endpoint') or BATCH_DEFAULT_ENDPOINT
+    file_path = write_batch_file(requests_list, endpoint, params.get('model'))
+    # the request file is registered in the action env by upload_file and cleaned up with it
+    batch_file = upload_file(config, {'file': file_path, 'purpose': 'Batch'}, *args, **kwargs)
+    payload = build_request_payload({
+        'input_file_id': batch_file['id'],
+        'endpoint': endpoint,
+        'completion_window': params.get('completion_window') or BATCH_COMPLETION_WINDOW,
+        'metadata': params.get('metadata'),
+        'timeout': params.get('timeout')
+    })
+    return get_client(config).batches.create(**payload).model_dump()
+
+
+def get_batch(config, params):
+    payload = build_request_payload(params)
+    return get_client(config).batches.retrieve(**payload).model_dump()
+
+
+def cancel_batch(config, params):
+    payload = build_request_payload(params)
+    return get_client(config).batches.cancel(**payload).model_dump()
+
+
+def _iter_batch_file(client, file_id, timeout):
+    with client.files.with_streaming_response.content(file_id=file_id, timeout=timeout) as response:
+        for line in response.iter_lines():
+            if line.strip():
+                yield json.loads(line)
+
+
+def _batch_result_order(result):
+    # results are written in completion order, restore the input order for the generated custom IDs
+    match = re.match(r'^request-(\d+)$', result['custom_id'] or '')
+    return (0, int(match.group(1)), '') if match else (1, 0, result['custom_id'] or '')
+
+
+def get_batch_results(config, params):
+    client = get_client(config)
+    timeout = params.get('timeout') if params.get('timeout') else 600
+    batch = client.batches.retrieve(batch_id=params.get('batch_id'), timeout=timeout).model_dump()
+    custom_ids = params.get('custom_ids')
+    if isinstance(custom_ids, str):
+        custom_ids = [custom_id.strip() for custom_id in custom_ids.split(',')]
+    custom_ids = set(custom_ids) if custom_ids else None
+    results = []
+    for file_id in [batch.get('output_file_id'), batch.get('error_file_id')]:
+        if not file_id:
+            continue
+        for line in _iter_batch_file(client, file_id, timeout):
+            if custom_ids is not None and line.get('custom_id') not in custom_ids:
+                continue
+            response = line.get('response') or {}
+            results.append({'custom_id': line.get('custom_id'), 'status_code': response.get('status_code'),
+                            'response': response.get('body'), 'error': line.get('error')})
+    results.sort(key=_batch_result_order)
+    return {'batch': batch, 'results': results}
 
 
 def handle_comma_separated_input(params, keys=[]):
@@ -0,0 +1,214 @@
+"""
+Copyright start
+MIT License
+Copyright (c) 2025 Fortinet Inc
+Copyright end
+"""
+import re
+import time
+import threading
+import contextvars
+
+from connectors.core.connector import get_logger
+from .constants import *
+from .tokenizer import encoding_registry, count_text_tokens
+
+logger = get_logger(LOGGER_NAME)
+
+# time the requests of the operation being executed were queued for, reported when it completes
+execution_waits = contextvars.ContextVar('execution_waits', default=None)
+
+DURATION_PATTERN = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+
+def _parse_duration(value):
+    ''' parses the x-ratelimit-reset-* header format, e.g. 1s, 6m0s or 20ms, into seconds '''
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    matches = DURATION_PATTERN.findall(value)
+    if not matches:
+        return None
+    return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in matches)
+
+
+def _parse_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def estimate_request_tokens(body, cache_dir=None):
+    ''' estimates the tokens a request counts against the tokens per minute limit: prompt plus completion budget;
+    the prompt is only tokenized with an encoding already loaded, the request is never held up to load one '''
+    if not isinstance(body, dict):
+        return 0
+    texts = []
+    for message in body.get('messages') or []:
+        content = message.get('content') if isinstance(message, dict) else None
+        if isinstance(content, str):
+            texts.append(content)
+        elif isinstance(content, list):
+            texts.extend(part.get('text') for part in content if isinstance(part, dict) and part.get('text'))
+    request_input = body.get('input') or body.get('prompt')
+    if isinstance(request_input, str):
+        texts.append(request_input)
+    elif isinstance(request_input, list):
+        texts.extend(item for item in request_input if isinstance(item, str))
+    prompt_tokens = 0
+    if texts:
+        encoding = encoding_registry.get_loaded(body.get('model'), cache_dir)
+        if encoding is not None:
+            prompt_tokens = sum(count_text_tokens(encoding, texts))
+        else:
+            # encoding not loaded yet, fall back to the ~4 characters per token rule of thumb
+            prompt_tokens = sum(len(text) for text in texts) // 4
+    completion_tokens = body.get('max_completion_tokens') or body.get('max_tokens') or 0
+    return prompt_tokens + (completion_tokens if isinstance(completion_tokens, int) else 0)
+
+
+class TokenBucket:
+    ''' token bucket refilled continuously up to capacity per minute; reservations may drive it negative, which is
+    the time the caller has to wait for the reservation to be covered '''
+
+    def __init__(self, capacity=None):
+        self.configured_capacity = capacity
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _set_capacity(self, capacity):
+        if capacity and capacity != self.capacity:
+            self.capacity = capacity
+            self.tokens = capacity if self.tokens is None else min(self.tokens, capacity)
+
+    def configure(self, capacity, now):
+        self._refill(now)
+        self.configured_capacity = capacity
+        self._set_capacity(capacity)
+
+    def _refill(self, now):
+        if self.capacity:
+            rate = self.capacity / 60.0
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * rate)
+        self.updated_at = now
+
+    def reserve(self, amount, now):
+        self._refill(now)
+        if not self.capacity:
+            return 0
+        # a single request larger than the bucket only has to wait for a full bucket
+        self.tokens -= min(amount, self.capacity)
+        return max(0.0, -self.tokens / (self.capacity / 60.0))
+
+    def update(self, limit, remaining, reset, now):
+        self._refill(now)
+        if limit:
+            # a configured limit below the server limit leaves room for other consumers of the same key
+            self._set_capacity(min(limit, self.configured_capacity) if self.configured_capacity else limit)
+        if not self.capacity or remaining is None:
+            return
+        self.tokens = min(self.tokens, remaining)
+        if remaining <= 0 and reset:
+            # the server budget is exhausted until the reset, hold new reservations back until then
+            self.tokens = min(self.tokens, -reset * self.capacity / 60.0)
+
+
+class RateLimiter:
+    ''' client side scheduler for the requests and tokens per minute limits of one configuration; callers are
+    queued until their reservation is covered instead of being sent into a 429 '''
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self._lock = threading.Lock()
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.total_requests = 0
+        self.queued_requests = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def configure(self, requests_per_minute, tokens_per_minute):
+        with self._lock:
+            now = time.monotonic()
+            if requests_per_minute != self.requests.configured_capacity:
+                self.requests.configure(requests_per_minute, now)
+            if tokens_per_minute != self.tokens.configured_capacity:
+                self.tokens.configure(tokens_per_minute, now)
+
+    def _reserve(self, tokens):
+        with self._lock:
+            now = time.monotonic()
+            wait = max(self.requests.reserve(1, now), self.tokens.reserve(tokens, now))
+            self.total_requests += 1
+            if wait > 0:
+                self.queued_requests += 1
+                self.queue_depth += 1
+                self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+            return wait
+
+    def _release(self, wait):
+        with self._lock:
+            self.queue_depth -= 1
+            self.total_wait_time += wait
+            self.max_wait_time = max(self.max_wait_time, wait)
+        waits = execution_waits.get()
+        if waits is not None:
+            waits.append(wait)
+
+    def acquire(self, tokens=0):
+        wait = self._reserve(tokens)
+        if wait > 0:
+            logger.info('Rate limit budget exhausted, request queued for {0:.2f}s'.format(wait))
+            try:
+                time.sleep(wait)
+            finally:
+                self._release(wait)
+        return wait
+
+    async def acquire_async(self, tokens=0):
+        import asyncio
+        wait = self._reserve(tokens)
+        if wait > 0:
+            logger.info('Rate limit budget exhausted, request queued for {0:.2f}s'.format(wait))
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self._release(wait)
+        return wait
+
+    def report(self, operation, waits):
+        ''' logs the queueing of one execution of the operation with the queue statistics of the configuration '''
+        logger.info('Operation {0} had {1} requests queued by the rate limit for {2:.2f}s, rate limiter of the '
+                    'configuration: {3}'.format(operation, len(waits), sum(waits), self.stats()))
+
+    def update_from_headers(self, headers):
+        if 'x-ratelimit-remaining-requests' not in headers and 'x-ratelimit-remaining-tokens' not in headers:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self.requests.update(_parse_int(headers.get('x-ratelimit-limit-requests')),
+                                 _parse_int(headers.get('x-ratelimit-remaining-requests')),
+                                 _parse_duration(headers.get('x-ratelimit-reset-requests')), now)
+            self.tokens.update(_parse_int(headers.get('x-ratelimit-limit-tokens')),
+                               _parse_int(headers.get('x-ratelimit-remaining-tokens')),
+                               _parse_duration(headers.get('x-ratelimit-reset-tokens')), now)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'requests_per_minute': self.requests.capacity,
+                'tokens_per_minute': self.tokens.capacity,
+                'queue_depth': self.queue_depth,
+                'max_queue_depth': self.max_queue_depth,
+                'total_requests': self.total_requests,
+                'queued_requests': self.queued_requests,
+                'total_wait_time': round(self.total_wait_time, 3),
+                'max_wait_time': round(self.max_wait_time, 3)
+            }
@@ -0,0 +1,210 @@
+"""
+Copyright start
+MIT License
+Copyright (c) 2025 Fortinet Inc
+Copyright end
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+from connectors.core.connector import get_logger
+from .constants import *
+from .client_pool import get_client_key
+
+logger = get_logger(LOGGER_NAME)
+
+
+def build_cache_key(config, openai_args):
+    ''' canonical hash of the endpoint identity and the final request arguments, the timeout excluded '''
+    request = {key: value for key, value in openai_args.items() if key not in ['timeout', 'stream', 'stream_options']}
+    canonical = json.dumps({'client': get_client_key(config), 'request': request}, sort_keys=True, default=str,
+                           separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    ''' a cache that cannot be read or written, e.g. a locked database or a full disk, counts as a miss and the request
+    goes to the API '''
+
+    def __init__(self, max_entries=RESPONSE_CACHE_MAX_ENTRIES, max_bytes=RESPONSE_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    def get(self, key):
+        try:
+            value = self._get(key, time.time())
+        except (sqlite3.Error, OSError) as err:
+            logger.warning('Response cache could not be read, the request is sent to the API: {0}'.format(err))
+            value = None
+        with self._stats_lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.bytes_saved += len(value)
+        return json.loads(value)
+
+    def set(self, key, response, ttl):
+        value = json.dumps(response).encode('utf-8')
+        if len(value) > self.max_bytes:
+            return
+        try:
+            self._set(key, value, time.time() + ttl)
+        except (sqlite3.Error, OSError) as err:
+            logger.warning('Response could not be cached: {0}'.format(err))
+
+    def stats(self):
+        try:
+            entries, size = self._usage()
+        except (sqlite3.Error, OSError) as err:
+            logger.warning('Response cache usage is not available: {0}'.format(err))
+            entries, size = None, None
+        with self._stats_lock:
+            return {'hits': self.hits, 'misses': self.misses, 'bytes_saved': self.bytes_saved,
+                    'entries': entries, 'bytes': size}
+
+
+class MemoryResponseCache(ResponseCache):
+    ''' in-process LRU cache bounded by entry count and bytes '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def _pop(self, key):
+        value, expires_at = self._entries.pop(key)
+        self._size -= len(value)
+
+    def _get(self, key, now):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= now:
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def _set(self, key, value, expires_at):
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = (value, expires_at)
+            self._size += len(value)
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+
+    def _usage(self):
+        with self._lock:
+            return len(self._entries), self._size
+
+
+class SQLiteResponseCache(ResponseCache):
+    ''' on-disk LRU cache shared by the worker processes of the node '''
+
+    def __init__(self, path=RESPONSE_CACHE_DB_PATH, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.path = path
+        # the cached responses may hold sensitive content, only the owner of the file can read it
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            os.fchmod(fd, 0o600)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+        connection = self._connect()
+        try:
+            connection.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value BLOB NOT NULL, '
+                               'size INTEGER NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)')
+        finally:
+            connection.close()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=RESPONSE_CACHE_DB_TIMEOUT, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        return connection
+
+    def _get(self, key, now):
+        connection = self._connect()
+        try:
+            row = connection.execute('SELECT value, expires_at FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+                return None
+            connection.execute('UPDATE responses SET last_access = ? WHERE key = ?', (now, key))
+            return bytes(row[0])
+        finally:
+            connection.close()
+
+    def _set(self, key, value, expires_at):
+        now = time.time()
+        connection = self._connect()
+        try:
+            # a BEGIN that fails, e.g. on a locked database, opens no transaction and is reported as is
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                connection.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)',
+                                   (key, value, len(value), expires_at, now))
+                connection.execute('DELETE FROM responses WHERE expires_at <= ?', (now,))
+                entries, size = connection.execute(
+                    'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+                # evict the least recently used entries until both bounds hold again
+                for row_key, row_size in connection.execute(
+                        'SELECT key, size FROM responses ORDER BY last_access').fetchall():
+                    if entries <= self.max_entries and size <= self.max_bytes:
+                        break
+                    connection.execute('DELETE FROM responses WHERE key = ?', (row_key,))
+                    entries, size = entries - 1, size - row_size
+                connection.execute('COMMIT')
+            except Exception:
+                if connection.in_transaction:
+                    connection.execute('ROLLBACK')
+                raise
+        finally:
+            connection.close()
+
+    def _usage(self):
+        connection = self._connect()
+        try:
+            return connection.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+        finally:
+            connection.close()
+
+
+response_caches = {}
+response_caches_lock = threading.Lock()
+RESPONSE_CACHE_BACKENDS = {
+    'Memory': MemoryResponseCache,
+    'Disk': SQLiteResponseCache
+}
+
+
+def get_response_cache(backend):
+    if backend not in RESPONSE_CACHE_BACKENDS:
+        return None
+    with response_caches_lock:
+        if backend not in response_caches:
+            try:
+                response_caches[backend] = RESPONSE_CACHE_BACKENDS[backend]()
+            except (sqlite3.Error, OSError) as err:
+                # created again on the next request, the cache may become available
+                logger.warning('{0} response cache is not available, the request is sent to the API: {1}'.format(
+                    backend, err))
+                return None
+        return response_caches[backend]
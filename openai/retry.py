@@ -0,0 +1,151 @@
+"""
+Copyright start
+MIT License
+Copyright (c) 2025 Fortinet Inc
+Copyright end
+"""
+import time
+import random
+import threading
+import contextvars
+from email.utils import parsedate_to_datetime
+
+from connectors.core.connector import get_logger
+from .constants import *
+
+logger = get_logger(LOGGER_NAME)
+
+# name of the connector operation being executed, used to attribute retries
+current_operation = contextvars.ContextVar('current_operation', default=None)
+# reasons of the retries made by the operation being executed, reported when it completes
+execution_retries = contextvars.ContextVar('execution_retries', default=None)
+
+
+def _to_number(value, default, cast=float):
+    try:
+        return cast(value) if value not in (None, '') else default
+    except (TypeError, ValueError):
+        return default
+
+
+def _to_list(value, default):
+    if value in (None, '', []):
+        return default
+    if isinstance(value, str):
+        value = value.split(',')
+    return [str(item).strip() for item in value if str(item).strip()]
+
+
+def in_current_context(function):
+    ''' wraps function to run in a copy of the context of the caller, the worker threads of an operation then attribute
+    their retries to it '''
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(function, *args, **kwargs)
+
+
+def get_retry_exceptions(error_types):
+    ''' exception classes of the selected error types, raised by httpx for the SDK clients and by requests for the REST
+    calls '''
+    import httpx
+    import requests
+    exceptions = {
+        'connection errors': (httpx.NetworkError, httpx.RemoteProtocolError, httpx.ProxyError,
+                              requests.exceptions.ConnectionError),
+        'timeouts': (httpx.TimeoutException, requests.exceptions.Timeout)
+    }
+    return tuple(exception for error_type in error_types for exception in exceptions.get(error_type.lower(), ()))
+
+
+def parse_retry_after(headers):
+    ''' returns the delay requested by the retry-after-ms or retry-after response header in seconds '''
+    if not headers:
+        return None
+    retry_after_ms = _to_number(headers.get('retry-after-ms'), None)
+    if retry_after_ms is not None:
+        return retry_after_ms / 1000.0
+    retry_after = headers.get('retry-after')
+    if not retry_after:
+        return None
+    seconds = _to_number(retry_after, None)
+    if seconds is not None:
+        return seconds
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    ''' retry policy of one configuration, shared by the SDK clients, make_rest_call and the run polling loops '''
+
+    def __init__(self, config=None):
+        self._lock = threading.Lock()
+        self.retries = {}
+        self.configure(config or {})
+
+    def configure(self, config):
+        self.max_retries = _to_number(config.get('max_retries'), RETRY_MAX_RETRIES, int)
+        self.base_delay = _to_number(config.get('retry_base_delay'), RETRY_BASE_DELAY)
+        self.max_delay = _to_number(config.get('retry_max_delay'), RETRY_MAX_DELAY)
+        self.jitter = min(max(_to_number(config.get('retry_jitter'), RETRY_JITTER), 0.0), 1.0)
+        status_codes = [_to_number(status_code, None, int) for status_code in
+                        _to_list(config.get('retry_status_codes'), RETRY_STATUS_CODES)]
+        self.retry_status_codes = [status_code for status_code in status_codes if status_code is not None]
+        self.retry_exceptions = get_retry_exceptions(_to_list(config.get('retry_on_errors'), RETRY_ERROR_TYPES))
+
+    def get_delay(self, attempt, headers=None):
+        retry_after = parse_retry_after(headers)
+        if retry_after is not None and 0 <= retry_after <= RETRY_AFTER_MAX_DELAY:
+            return retry_after
+        delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+        # jitter spreads out the retries of callers that failed together
+        return delay * (1 - self.jitter * random.random())
+
+    def should_retry_status(self, status_code, attempt):
+        return attempt < self.max_retries and status_code in self.retry_status_codes
+
+    def should_retry_exception(self, error, attempt):
+        return attempt < self.max_retries and isinstance(error, self.retry_exceptions)
+
+    def record_retry(self, reason, attempt, delay):
+        operation = current_operation.get() or 'unknown'
+        with self._lock:
+            self.retries[operation] = self.retries.get(operation, 0) + 1
+        retries = execution_retries.get()
+        if retries is not None:
+            retries.append(reason)
+        logger.warning('Operation {0}: {1}, retrying in {2:.2f}s (retry {3} of {4})'.format(
+            operation, reason, delay, attempt + 1, self.max_retries))
+
+    def stats(self):
+        with self._lock:
+            return {'max_retries': self.max_retries, 'retries': dict(self.retries)}
+
+    def report(self, operation, retries):
+        ''' logs the retries made by one execution of the operation with the retry counts of the configuration '''
+        reasons = {}
+        for reason in retries:
+            reasons[reason] = reasons.get(reason, 0) + 1
+        logger.info('Operation {0} was retried {1} times ({2}), retries of the configuration by operation: '
+                    '{3}'.format(operation, len(retries), ', '.join('{0} x{1}'.format(reason, count) for reason, count
+                                                                   in reasons.items()), self.stats()['retries']))
+
+    def call(self, function, *args, **kwargs):
+        ''' calls function with retries, for callers outside of the SDK clients, e.g. requests based REST calls '''
+        attempt = 0
+        while True:
+            try:
+                response = function(*args, **kwargs)
+            except Exception as error:
+                if not self.should_retry_exception(error, attempt):
+                    raise
+                delay = self.get_delay(attempt)
+                self.record_retry(type(error).__name__, attempt, delay)
+            else:
+                status_code = getattr(response, 'status_code', None)
+                if not self.should_retry_status(status_code, attempt):
+                    return response
+                delay = self.get_delay(attempt, response.headers)
+                self.record_retry('HTTP {0}'.format(status_code), attempt, delay)
+            time.sleep(delay)
+            attempt += 1
@@ -0,0 +1,171 @@
+"""
+Copyright start
+MIT License
+Copyright (c) 2025 Fortinet Inc
+Copyright end
+"""
+import os
+import re
+import time
+import struct
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+from connectors.core.connector import get_logger, ConnectorError
+from .constants import *
+from .client_pool import get_client
+from .retry import in_current_context
+
+logger = get_logger(LOGGER_NAME)
+
+SENTENCE_END_PATTERN = re.compile(r'(?<=[.!?;。！？])\s+')
+
+
+def _split_long_sentences(sentences, max_chars):
+    for sentence in sentences:
+        while len(sentence) > max_chars:
+            # a sentence longer than a segment is cut on its last word boundary that fits
+            cut = sentence.rfind(' ', 0, max_chars + 1)
+            if cut <= 0:
+                cut = max_chars
+            yield sentence[:cut]
+            sentence = sentence[cut:].lstrip()
+        if sentence:
+            yield sentence
+
+
+def split_speech_text(text, max_chars=SPEECH_MAX_INPUT_CHARS):
+    ''' splits the text into segments of whole sentences within the input limit of the speech API '''
+    if len(text) <= max_chars:
+        return [text]
+    segments = []
+    current = ''
+    for sentence in _split_long_sentences(SENTENCE_END_PATTERN.split(text.strip()), max_chars):
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            segments.append(current)
+            current = sentence
+        else:
+            current = '{0} {1}'.format(current, sentence) if current else sentence
+    if current:
+        segments.append(current)
+    return segments
+
+
+def get_speech_segments(text, response_format):
+    segments = split_speech_text(text)
+    if len(segments) > 1 and response_format not in SPEECH_CONCATENABLE_FORMATS:
+        raise ConnectorError('The input of {0} characters exceeds the limit of {1} characters for one request, and '
+                             'the {2} format cannot be joined from segments. Use one of {3} for long inputs.'.format(
+                                 len(text), SPEECH_MAX_INPUT_CHARS, response_format,
+                                 ', '.join(SPEECH_CONCATENABLE_FORMATS)))
+    return segments
+
+
+def get_wav_data_offset(header):
+    ''' offset of the samples in a RIFF/WAVE stream, right after the header of its data chunk '''
+    if header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+        raise ConnectorError('The speech segment is not a WAV stream and cannot be joined.')
+    offset = 12
+    while offset + 8 <= len(header):
+        chunk_id, size = header[offset:offset + 4], struct.unpack('<I', header[offset + 4:offset + 8])[0]
+        if chunk_id == b'data':
+            return offset + 8
+        offset += 8 + size + (size & 1)
+    raise ConnectorError('No data chunk found in the header of the WAV speech segment.')
+
+
+def join_speech_segments(speech_file_path, part_paths, response_format):
+    ''' appends the segments to the audio of the first one in order; WAV segments are appended without their header
+    and the sizes in the header of the joined file are updated '''
+    with open(speech_file_path, 'r+b') as speech_file:
+        data_offset = get_wav_data_offset(speech_file.read(SPEECH_WAV_HEADER_MAX_SIZE)) \
+            if response_format == 'wav' else 0
+        speech_file.seek(0, os.SEEK_END)
+        for part_path in part_paths:
+            with open(part_path, 'rb') as part_file:
+                if response_format == 'wav':
+                    part_file.seek(get_wav_data_offset(part_file.read(SPEECH_WAV_HEADER_MAX_SIZE)))
+                shutil.copyfileobj(part_file, speech_file, SPEECH_CHUNK_SIZE)
+        size = speech_file.tell()
+        if response_format == 'wav':
+            speech_file.seek(4)
+            speech_file.write(struct.pack('<I', min(size - 8, 0xFFFFFFFF)))
+            speech_file.seek(data_offset - 4)
+            speech_file.write(struct.pack('<I', min(size - data_offset, 0xFFFFFFFF)))
+    return size
+
+
+def get_part_paths(speech_file_path, segments):
+    ''' the first segment is written to the speech file itself, the others to part files next to it '''
+    return [str(speech_file_path)] + ['{0}.part{1}'.format(speech_file_path, index)
+                                      for index in range(1, len(segments))]
+
+
+def remove_part_files(part_paths):
+    for part_path in part_paths[1:]:
+        try:
+            os.remove(part_path)
+        except OSError:
+            pass
+
+
+def synthesize_segment(client, payload, text, path, start):
+    ''' streams the audio of one segment to its file, returns the time to its first byte '''
+    time_to_first_byte = None
+    with client.audio.speech.with_streaming_response.create(**dict(payload, input=text)) as response:
+        with open(path, 'wb') as part_file:
+            # the chunks are written as they arrive, a chunk size would hold back the first audio until it fills
+            for chunk in response.iter_bytes():
+                if time_to_first_byte is None:
+                    time_to_first_byte = time.perf_counter() - start
+                part_file.write(chunk)
+    return time_to_first_byte
+
+
+async def synthesize_segment_async(client, payload, text, path, start):
+    time_to_first_byte = None
+    async with client.audio.speech.with_streaming_response.create(**dict(payload, input=text)) as response:
+        with open(path, 'wb') as part_file:
+            async for chunk in response.iter_bytes():
+                if time_to_first_byte is None:
+                    time_to_first_byte = time.perf_counter() - start
+                part_file.write(chunk)
+    return time_to_first_byte
+
+
+def plan_speech(payload, speech_file_path):
+    ''' the segments of the input, the files their audio is written to and the number of them synthesized at once '''
+    response_format = payload.get('response_format') or 'mp3'
+    segments = get_speech_segments(payload['input'], response_format)
+    return response_format, segments, get_part_paths(speech_file_path, segments), \
+        min(SPEECH_MAX_WORKERS, len(segments))
+
+
+def finish_speech(speech_file_path, part_paths, response_format):
+    ''' joins the segments into the speech file, returns its size '''
+    if len(part_paths) > 1:
+        return join_speech_segments(speech_file_path, part_paths[1:], response_format)
+    return os.path.getsize(speech_file_path)
+
+
+def synthesize_speech(config, payload, speech_file_path):
+    ''' streams the speech of the input to the file, long inputs as segments synthesized concurrently '''
+    start = time.perf_counter()
+    response_format, segments, part_paths, workers = plan_speech(payload, speech_file_path)
+    client = get_client(config)
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='openai-speech') as executor:
+            synthesize = in_current_context(synthesize_segment)
+            futures = [executor.submit(synthesize, client, payload, text, path, start)
+                       for text, path in zip(segments, part_paths)]
+            first_bytes = [future.result() for future in futures]
+        size = finish_speech(speech_file_path, part_paths, response_format)
+    finally:
+        remove_part_files(part_paths)
+    return get_speech_stats(segments, first_bytes, size, start)
+
+
+def get_speech_stats(segments, first_bytes, size, start):
+    return {'segments': len(segments), 'bytes': size,
+            'time_to_first_byte': round(first_bytes[0], 3) if first_bytes[0] is not None else None,
+            'total_time': round(time.perf_counter() - start, 3)}
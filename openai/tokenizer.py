@@ -0,0 +1,261 @@
+"""
+Copyright start
+MIT License
+Copyright (c) 2025 Fortinet Inc
+Copyright end
+"""
+import os
+import time
+import threading
+
+from connectors.core.connector import get_logger, ConnectorError
+from .constants import *
+
+logger = get_logger(LOGGER_NAME)
+
+
+def get_encoding_name(model):
+    ''' maps a model or deployment name to its encoding: exact and prefix names known to tiktoken first, then the
+    model family, so that new model versions and fine-tuned models resolve without a tiktoken upgrade '''
+    import tiktoken.model
+    model = (model or '').strip().lower()
+    if model.startswith('ft:'):
+        model = model.split(':')[1]
+    try:
+        return tiktoken.model.encoding_name_for_model(model)
+    except KeyError:
+        pass
+    for prefix, encoding_name in TOKENIZER_MODEL_FAMILIES:
+        if model.startswith(prefix):
+            return encoding_name
+    return TOKENIZER_DEFAULT_ENCODING
+
+
+class EncodingRegistry:
+    ''' process wide, thread-safe cache of the loaded tiktoken encodings; BPE ranks are read from the local cache
+    directory when one is available and a failed load is not retried on every call, which would stall each request
+    on hosts without internet access '''
+
+    def __init__(self):
+        self._encodings = {}
+        self._failures = {}
+        self._lock = threading.Lock()
+        self._loading = {}
+        self._warming = set()
+
+    @staticmethod
+    def get_cache_dir(config=None):
+        return (config or {}).get('tokenizer_cache_dir') or os.environ.get('TIKTOKEN_CACHE_DIR') or None
+
+    @staticmethod
+    def _load_from_cache_dir(encoding_name, cache_dir):
+        ''' builds the encoding from its BPE file in the cache directory; the process environment, from which
+        tiktoken resolves its own cache directory, is left untouched '''
+        import types
+        import hashlib
+        import tiktoken
+        from tiktoken.load import load_tiktoken_bpe
+        from tiktoken_ext import openai_public
+        constructor = openai_public.ENCODING_CONSTRUCTORS.get(encoding_name)
+        if constructor is None:
+            raise ValueError('Unknown encoding {0}'.format(encoding_name))
+
+        def load_cached_bpe(blobpath, expected_hash=None):
+            # files cached by tiktoken are named by the SHA-1 of their URL, files copied by hand by the encoding
+            for name in [hashlib.sha1(blobpath.encode()).hexdigest(), '{0}.tiktoken'.format(encoding_name)]:
+                path = os.path.join(cache_dir, name)
+                if os.path.isfile(path):
+                    return load_tiktoken_bpe(path, expected_hash)
+            raise FileNotFoundError('{0} not found in {1}'.format(blobpath, cache_dir))
+        # a copy of the constructor with its own globals reads the BPE file from the cache directory, the
+        # arguments of the encoding (pattern, special tokens) still come from tiktoken
+        constructor = types.FunctionType(constructor.__code__,
+                                         dict(constructor.__globals__, load_tiktoken_bpe=load_cached_bpe),
+                                         constructor.__name__, constructor.__defaults__, constructor.__closure__)
+        return tiktoken.Encoding(**constructor())
+
+    def _load(self, encoding_name, cache_dir):
+        if not cache_dir:
+            import tiktoken
+            return tiktoken.get_encoding(encoding_name)
+        return self._load_from_cache_dir(encoding_name, cache_dir)
+
+    def get_encoding(self, encoding_name, config=None):
+        encoding = self._encodings.get(encoding_name)
+        if encoding is not None:
+            return encoding
+        with self._lock:
+            encoding = self._encodings.get(encoding_name)
+            if encoding is not None:
+                return encoding
+            cache_dir = self.get_cache_dir(config)
+            failure = self._failures.get((encoding_name, cache_dir))
+            if failure and time.monotonic() - failure[0] < TOKENIZER_LOAD_RETRY_INTERVAL:
+                raise ConnectorError(failure[1])
+            # one loader per encoding, concurrent callers wait for it instead of loading the BPE file again
+            loading = self._loading.setdefault(encoding_name, threading.Lock())
+        with loading:
+            encoding = self._encodings.get(encoding_name)
+            if encoding is not None:
+                return encoding
+            start = time.perf_counter()
+            try:
+                encoding = self._load(encoding_name, cache_dir)
+            except Exception as err:
+                message = 'Unable to load the {0} tokenizer encoding, populate the tokenizer cache ' \
+                          'directory ({1}): {2}'.format(encoding_name, cache_dir or 'not configured', err)
+                logger.error(message)
+                with self._lock:
+                    self._failures[(encoding_name, cache_dir)] = (time.monotonic(), message)
+                raise ConnectorError(message)
+            logger.info('Loaded the {0} tokenizer encoding in {1:.3f}s'.format(encoding_name,
+                                                                               time.perf_counter() - start))
+            with self._lock:
+                self._encodings[encoding_name] = encoding
+                self._failures = {key: value for key, value in self._failures.items() if key[0] != encoding_name}
+            return encoding
+
+    def for_model(self, model, config=None):
+        return self.get_encoding(get_encoding_name(model), config)
+
+    def get_loaded(self, model, cache_dir=None):
+        ''' the encoding of the model if it is already loaded; the caller is never blocked on loading it, with a
+        cache directory a missing encoding is loaded in the background for the next callers '''
+        if not self._encodings and not cache_dir:
+            return None
+        encoding_name = get_encoding_name(model)
+        encoding = self._encodings.get(encoding_name)
+        if encoding is None and cache_dir:
+            self.warm_up({'tokenizer_cache_dir': cache_dir}, [encoding_name])
+        return encoding
+
+    def warm_up(self, config=None, encoding_names=TOKENIZER_WARM_UP_ENCODINGS):
+        ''' loads the encodings in a background thread so that the first token count does not pay for it '''
+        cache_dir = self.get_cache_dir(config)
+        now = time.monotonic()
+        with self._lock:
+            # an encoding already loading, loaded or failing recently is not loaded again
+            encoding_names = [encoding_name for encoding_name in encoding_names
+                              if encoding_name not in self._encodings and encoding_name not in self._warming and
+                              now - self._failures.get((encoding_name, cache_dir), (-float('inf'),))[0] >=
+                              TOKENIZER_LOAD_RETRY_INTERVAL]
+            self._warming.update(encoding_names)
+        if not encoding_names:
+            return None
+
+        def load():
+            for encoding_name in encoding_names:
+                try:
+                    self.get_encoding(encoding_name, config)
+                except ConnectorError:
+                    pass
+                finally:
+                    with self._lock:
+                        self._warming.discard(encoding_name)
+        thread = threading.Thread(target=load, name='openai-tokenizer-warm-up', daemon=True)
+        thread.start()
+        return thread
+
+
+def get_message_overhead(model):
+    ''' returns the tokens added per message, per name field and to prime the reply in the chat format '''
+    model = (model or '').strip().lower()
+    for prefix, overhead in TOKENIZER_MESSAGE_OVERHEAD:
+        if model.startswith(prefix):
+            return overhead
+    return TOKENIZER_DEFAULT_MESSAGE_OVERHEAD
+
+
+def get_message_texts(message):
+    ''' returns the texts of a chat message that count against the prompt: role, name, text content parts and
+    tool calls '''
+    texts = [message.get('role') or '']
+    content = message.get('content')
+    if isinstance(content, str):
+        texts.append(content)
+    elif isinstance(content, list):
+        texts.extend(part.get('text') for part in content if isinstance(part, dict) and part.get('text'))
+    if message.get('name'):
+        texts.append(message['name'])
+    for tool_call in message.get('tool_calls') or []:
+        function = tool_call.get('function') or {}
+        texts.extend([function.get('name') or '', function.get('arguments') or ''])
+    return texts
+
+
+def count_text_tokens(encoding, texts, num_threads=TOKENIZER_BATCH_THREADS):
+    ''' token counts of many texts in one batch encoded on worker threads, special tokens count as plain text '''
+    # tiktoken releases the GIL while encoding, extra threads only help with spare cores to run them
+    num_threads = min(num_threads, os.cpu_count() or 1)
+    if num_threads < 2 or len(texts) < TOKENIZER_BATCH_MIN_SIZE:
+        return [len(encoding.encode_ordinary(text)) for text in texts]
+    return [len(tokens) for tokens in encoding.encode_ordinary_batch(texts, num_threads=num_threads)]
+
+
+def count_message_tokens(encoding, messages, model, num_threads=TOKENIZER_BATCH_THREADS):
+    ''' token counts of the messages of a chat request including the chat format overhead, returns the per message
+    counts and the prompt total '''
+    tokens_per_message, tokens_per_name, reply_tokens = get_message_overhead(model)
+    message_texts = [get_message_texts(message) for message in messages]
+    counts = iter(count_text_tokens(encoding, [text for texts in message_texts for text in texts], num_threads))
+    items = []
+    for message, texts in zip(messages, message_texts):
+        tokens = tokens_per_message + sum(next(counts) for _ in texts)
+        items.append(tokens + (tokens_per_name if message.get('name') else 0))
+    return items, sum(items) + (reply_tokens if messages else 0)
+
+
+def get_context_window(model):
+    model = (model or '').strip().lower()
+    if model.startswith('ft:'):
+        model = model.split(':')[1]
+    for prefix, context_window in MODEL_CONTEXT_WINDOWS:
+        if model.startswith(prefix):
+            return context_window
+    return None
+
+
+def fit_messages(encoding, messages, model, budget):
+    ''' drops the oldest turns, a user message with the replies and tool results that follow it, until the prompt
+    fits the token budget; the leading system messages and the latest user message are always kept '''
+    items, total = count_message_tokens(encoding, messages, model)
+    report = {'original_prompt_tokens': total, 'prompt_tokens': total, 'budget': budget, 'dropped_messages': 0,
+              'dropped_tokens': 0, 'dropped': []}
+    if total <= budget:
+        return messages, report
+    protected = set()
+    for index, message in enumerate(messages):
+        if message.get('role') not in ['system', 'developer']:
+            break
+        protected.add(index)
+    user_indexes = [index for index, message in enumerate(messages) if message.get('role') == 'user']
+    if user_indexes:
+        protected.add(user_indexes[-1])
+    turns = []
+    for index in range(len(messages)):
+        if index in protected:
+            continue
+        if not turns or messages[index].get('role') == 'user' or index - 1 in protected:
+            turns.append([])
+        turns[-1].append(index)
+    dropped = set()
+    for turn in turns:
+        if total <= budget:
+            break
+        for index in turn:
+            dropped.add(index)
+            total -= items[index]
+            report['dropped'].append({'index': index, 'role': messages[index].get('role'), 'tokens': items[index]})
+    if total > budget:
+        raise ConnectorError('The system message and the latest user message need {0} tokens, which exceeds the {1} '
+                             'tokens left for the prompt in the context window of the model.'.format(total, budget))
+    report.update({'prompt_tokens': total, 'dropped_messages': len(dropped),
+                   'dropped_tokens': report['original_prompt_tokens'] - total})
+    return [message for index, message in enumerate(messages) if index not in dropped], report
+
+
+encoding_registry = EncodingRegistry()
+
+
+def get_encoding(model, config=None):
+    return encoding_registry.for_model(model, config)
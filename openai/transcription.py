@@ -0,0 +1,225 @@
+"""
+Copyright start
+MIT License
+Copyright (c) 2025 Fortinet Inc
+Copyright end
+"""
+import io
+import os
+import re
+import time
+import wave
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+from connectors.core.connector import get_logger, ConnectorError
+from .constants import *
+from .client_pool import get_client
+from .retry import in_current_context
+from .uploads import FilePart
+from .speech import get_wav_data_offset
+
+logger = get_logger(LOGGER_NAME)
+
+
+class WavSegment(io.RawIOBase):
+    ''' a WAV file of a time range of another one, its header followed by a window on the samples of the original
+    file, so that segments are sent without being copied '''
+
+    def __init__(self, header, samples):
+        super().__init__()
+        self.header = header
+        self.samples = samples
+        self.size = len(header) + samples.size
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        elif whence == os.SEEK_END:
+            offset += self.size
+        self.position = max(0, min(offset, self.size))
+        return self.position
+
+    def readinto(self, buffer):
+        if self.position < len(self.header):
+            data = self.header[self.position:self.position + len(buffer)]
+        else:
+            self.samples.seek(self.position - len(self.header))
+            data = self.samples.read(len(buffer))
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+def build_wav_header(channels, sample_width, frame_rate, frames):
+    data_size = frames * channels * sample_width
+    return b''.join([b'RIFF', struct.pack('<I', 36 + data_size), b'WAVE', b'fmt ',
+                     struct.pack('<IHHIIHH', 16, 1, channels, frame_rate, frame_rate * channels * sample_width,
+                                 channels * sample_width, sample_width * 8),
+                     b'data', struct.pack('<I', data_size)])
+
+
+def validate_segment_settings(segment_duration, overlap):
+    ''' returns the segment duration and overlap in seconds, the overlap has to leave part of each segment new '''
+    try:
+        segment_duration, overlap = float(segment_duration), float(overlap)
+    except (TypeError, ValueError):
+        raise ConnectorError('Segment Duration and Segment Overlap must be numbers of seconds.')
+    if segment_duration <= 0:
+        raise ConnectorError('Segment Duration must be greater than 0 seconds, got {0}.'.format(segment_duration))
+    if not 0 <= overlap < segment_duration:
+        raise ConnectorError('Segment Overlap must be at least 0 and less than the Segment Duration of {0} seconds, '
+                             'got {1}.'.format(segment_duration, overlap))
+    return segment_duration, overlap
+
+
+def plan_audio_segments(frames, frame_rate, frame_size, segment_duration, overlap):
+    ''' (start, end) frames of overlapping segments covering the audio, each within the upload limit of the API '''
+    segment_duration, overlap = validate_segment_settings(segment_duration, overlap)
+    max_frames = (TRANSCRIPTION_MAX_FILE_SIZE - TRANSCRIPTION_HEADER_SIZE) // frame_size
+    segment_frames = min(int(segment_duration * frame_rate), max_frames)
+    if segment_frames < 1:
+        raise ConnectorError('Segment Duration of {0} seconds is shorter than one frame of the audio.'.format(
+            segment_duration))
+    overlap_frames = min(int(overlap * frame_rate), segment_frames // 2)
+    step = segment_frames - overlap_frames
+    segments = []
+    start = 0
+    while True:
+        end = min(start + segment_frames, frames)
+        segments.append((start, end))
+        if end >= frames:
+            return segments
+        start += step
+
+
+def _normalize_words(words):
+    return [re.sub(r'\W', '', word.lower()) for word in words]
+
+
+def count_repeated_words(previous, words):
+    ''' length of the longest run of normalized words that starts the words and ends the previous ones '''
+    normalized = _normalize_words(words[:TRANSCRIPTION_OVERLAP_MAX_WORDS])
+    for size in range(min(TRANSCRIPTION_OVERLAP_MAX_WORDS, len(previous), len(normalized)), 0, -1):
+        if previous[-size:] == normalized[:size]:
+            return size
+    return 0
+
+
+def join_overlapping_texts(texts):
+    ''' joins the texts of consecutive segments, dropping the words a text repeats from the end of the previous one '''
+    words = []
+    for text in texts:
+        new_words = text.split()
+        words.extend(new_words[count_repeated_words(_normalize_words(words[-TRANSCRIPTION_OVERLAP_MAX_WORDS:]),
+                                                    new_words):])
+    return ' '.join(words)
+
+
+def _drop_repeated_words(previous, segments):
+    ''' removes from the first segments the words they repeat from the end of the previous segments '''
+    repeated = count_repeated_words(previous, ' '.join(segment['text'] for segment in segments).split())
+    while repeated and segments:
+        words = segments[0]['text'].split()
+        if len(words) <= repeated:
+            repeated -= len(words)
+            segments.pop(0)
+        else:
+            segments[0]['text'] = ' {0}'.format(' '.join(words[repeated:]))
+            repeated = 0
+    return segments
+
+
+def _keep_in_range(items, offset, own_start, own_end):
+    ''' the items whose middle falls in the time range the segment owns, moved to the timeline of the audio '''
+    kept = []
+    for item in items or []:
+        start, end = item['start'] + offset, item['end'] + offset
+        if own_start <= (start + end) / 2 < own_end:
+            kept.append(dict(item, start=round(start, 3), end=round(end, 3)))
+    return kept
+
+
+def stitch_transcriptions(results, bounds, duration):
+    ''' merges the verbose transcriptions of the overlapping segments; a segment owns the audio up to the middle of
+    its overlaps with the neighbouring segments and the timestamps are moved by the start of the segment '''
+    segments, words = [], []
+    for index, (result, (start, end)) in enumerate(zip(results, bounds)):
+        own_start = 0 if index == 0 else (start + bounds[index - 1][1]) / 2
+        own_end = duration if index == len(bounds) - 1 else (bounds[index + 1][0] + end) / 2
+        kept = _keep_in_range(result.get('segments'), start, own_start, own_end)
+        if segments:
+            # a segment that starts in the overlap repeats the end of the previous one, the model cuts segments
+            # at its own pauses and not at the middle of the overlap
+            previous = ' '.join(segment['text'] for segment in segments[-TRANSCRIPTION_OVERLAP_MAX_WORDS:]).split()
+            kept = _drop_repeated_words(_normalize_words(previous[-TRANSCRIPTION_OVERLAP_MAX_WORDS:]), kept)
+        for segment in kept:
+            segment['id'] = len(segments)
+            if 'seek' in segment:
+                # seek counts the 10 ms frames of the model input
+                segment['seek'] += int(start * 100)
+            segments.append(segment)
+        words.extend(_keep_in_range(result.get('words'), start, own_start, own_end))
+    if segments:
+        text = ' '.join(segment['text'].strip() for segment in segments)
+    else:
+        text = join_overlapping_texts(result.get('text') or '' for result in results)
+    stitched = {'text': text}
+    if results[0].get('language') is not None:
+        stitched.update({'task': results[0].get('task'), 'language': results[0]['language'],
+                         'duration': round(duration, 3)})
+    if any(result.get('segments') is not None for result in results):
+        stitched['segments'] = segments
+    if any(result.get('words') is not None for result in results):
+        stitched['words'] = words
+    return stitched
+
+
+def transcribe_in_segments(config, payload, segment_duration=TRANSCRIPTION_SEGMENT_DURATION,
+                           overlap=TRANSCRIPTION_SEGMENT_OVERLAP, concurrency=TRANSCRIPTION_MAX_WORKERS):
+    ''' transcribes long WAV audio as overlapping segments sent concurrently and stitches their transcriptions '''
+    filename, file = payload['file']
+    segment_duration, overlap = validate_segment_settings(segment_duration, overlap)
+    start_time = time.perf_counter()
+    try:
+        with wave.open(file) as audio:
+            channels, sample_width, frame_rate, frames = audio.getparams()[:4]
+    except (wave.Error, EOFError) as err:
+        raise ConnectorError('Segmented transcription supports WAV (PCM) audio only, {0} cannot be split: '
+                             '{1}'.format(filename, err))
+    file.seek(0)
+    data_offset = get_wav_data_offset(file.read(TRANSCRIPTION_HEADER_MAX_SIZE))
+    frame_size = channels * sample_width
+    bounds = plan_audio_segments(frames, frame_rate, frame_size, segment_duration, overlap)
+    client = get_client(config)
+    name, extension = os.path.splitext(filename)
+
+    def transcribe(index, start, end):
+        segment = WavSegment(build_wav_header(channels, sample_width, frame_rate, end - start),
+                             FilePart(file.fileno(), data_offset + start * frame_size, (end - start) * frame_size))
+        segment_payload = dict(payload, file=('{0}_{1}{2}'.format(name, index, extension), segment))
+        return client.audio.transcriptions.create(**segment_payload).model_dump()
+
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(bounds))),
+                            thread_name_prefix='openai-transcription') as executor:
+        transcribe = in_current_context(transcribe)
+        futures = [executor.submit(transcribe, index, start, end) for index, (start, end) in enumerate(bounds)]
+        results = [future.result() for future in futures]
+    bounds = [(start / frame_rate, end / frame_rate) for start, end in bounds]
+    response = stitch_transcriptions(results, bounds, frames / frame_rate)
+    response['audio_segments'] = {'count': len(bounds), 'segment_duration': round(bounds[0][1] - bounds[0][0], 3),
+                                  'overlap': round(bounds[0][1] - bounds[1][0], 3) if len(bounds) > 1 else 0,
+                                  'elapsed_time': round(time.perf_counter() - start_time, 3)}
+    logger.info('Transcribed {0} in {1} segments in {2}s'.format(filename, len(bounds),
+                                                                 response['audio_segments']['elapsed_time']))
+    return response
@@ -0,0 +1,120 @@
+"""
+Copyright start
+MIT License
+Copyright (c) 2025 Fortinet Inc
+Copyright end
+"""
+import json
+import time
+import asyncio
+
+import httpx
+from .rate_limiter import estimate_request_tokens
+
+
+def _is_json_request(request):
+    # multipart uploads and other non JSON bodies only count against the requests limit
+    return request.headers.get('content-type', '').startswith('application/json')
+
+
+def _request_tokens(request, cache_dir=None):
+    try:
+        return estimate_request_tokens(json.loads(request.content), cache_dir)
+    except Exception:
+        return 0
+
+
+class RateLimitedTransport(httpx.BaseTransport):
+
+    def __init__(self, rate_limiter, transport, cache_dir=None):
+        self.rate_limiter = rate_limiter
+        self.transport = transport
+        self.cache_dir = cache_dir
+
+    def handle_request(self, request):
+        self.rate_limiter.acquire(_request_tokens(request, self.cache_dir) if _is_json_request(request) else 0)
+        response = self.transport.handle_request(request)
+        self.rate_limiter.update_from_headers(response.headers)
+        return response
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncRateLimitedTransport(httpx.AsyncBaseTransport):
+
+    def __init__(self, rate_limiter, transport, cache_dir=None):
+        self.rate_limiter = rate_limiter
+        self.transport = transport
+        self.cache_dir = cache_dir
+
+    async def handle_async_request(self, request):
+        tokens = 0
+        if _is_json_request(request):
+            # parsing and tokenizing a long prompt would hold up the other requests of the event loop
+            tokens = await asyncio.to_thread(_request_tokens, request, self.cache_dir)
+        await self.rate_limiter.acquire_async(tokens)
+        response = await self.transport.handle_async_request(request)
+        self.rate_limiter.update_from_headers(response.headers)
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class RetryTransport(httpx.BaseTransport):
+
+    def __init__(self, retry_policy, transport):
+        self.retry_policy = retry_policy
+        self.transport = transport
+
+    def handle_request(self, request):
+        attempt = 0
+        while True:
+            try:
+                response = self.transport.handle_request(request)
+            except Exception as error:
+                if not self.retry_policy.should_retry_exception(error, attempt):
+                    raise
+                delay = self.retry_policy.get_delay(attempt)
+                self.retry_policy.record_retry(type(error).__name__, attempt, delay)
+            else:
+                if not self.retry_policy.should_retry_status(response.status_code, attempt):
+                    return response
+                delay = self.retry_policy.get_delay(attempt, response.headers)
+                self.retry_policy.record_retry('HTTP {0}'.format(response.status_code), attempt, delay)
+                response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncRetryTransport(httpx.AsyncBaseTransport):
+
+    def __init__(self, retry_policy, transport):
+        self.retry_policy = retry_policy
+        self.transport = transport
+
+    async def handle_async_request(self, request):
+        attempt = 0
+        while True:
+            try:
+                response = await self.transport.handle_async_request(request)
+            except Exception as error:
+                if not self.retry_policy.should_retry_exception(error, attempt):
+                    raise
+                delay = self.retry_policy.get_delay(attempt)
+                self.retry_policy.record_retry(type(error).__name__, attempt, delay)
+            else:
+                if not self.retry_policy.should_retry_status(response.status_code, attempt):
+                    return response
+                delay = self.retry_policy.get_delay(attempt, response.headers)
+                self.retry_policy.record_retry('HTTP {0}'.format(response.status_code), attempt, delay)
+                await response.aclose()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def aclose(self):
+        await self.transport.aclose()
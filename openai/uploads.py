@@ -0,0 +1,207 @@
+"""
+Copyright start
+MIT License
+Copyright (c) 2025 Fortinet Inc
+Copyright end
+"""
+import io
+import os
+import json
+import time
+import hashlib
+import mimetypes
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from connectors.core.connector import get_logger, ConnectorError
+from .constants import *
+from .client_pool import get_client
+from .retry import in_current_context
+
+logger = get_logger(LOGGER_NAME)
+
+
+class FilePart(io.RawIOBase):
+    ''' read-only window on a byte range of an open file; reads go through pread, so the parts of one file are sent
+    concurrently from a single descriptor without buffering them '''
+
+    def __init__(self, fd, offset, size):
+        super().__init__()
+        self.fd = fd
+        self.offset = offset
+        self.size = size
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        elif whence == os.SEEK_END:
+            offset += self.size
+        self.position = max(0, min(offset, self.size))
+        return self.position
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self.size - self.position)
+        if size <= 0:
+            return 0
+        data = os.pread(self.fd, size, self.offset + self.position)
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+def get_mime_type(filename):
+    extension = os.path.splitext(filename)[1].lower()
+    return UPLOAD_MIME_TYPES.get(extension) or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+
+def get_file_fingerprint(fd, filename, size, purpose):
+    ''' identifies the content of a file for resuming its upload without hashing it whole: name, size, purpose, the
+    inode and modification time, and the first and last block; a file rewritten in place gets a new modification
+    time, so its middle blocks are never resumed from a previous version '''
+    stat = os.fstat(fd)
+    digest = hashlib.sha256(json.dumps([filename, size, purpose, stat.st_dev, stat.st_ino,
+                                        stat.st_mtime_ns]).encode('utf-8'))
+    digest.update(os.pread(fd, UPLOAD_FINGERPRINT_BLOCK_SIZE, 0))
+    digest.update(os.pread(fd, UPLOAD_FINGERPRINT_BLOCK_SIZE, max(0, size - UPLOAD_FINGERPRINT_BLOCK_SIZE)))
+    return digest.hexdigest()
+
+
+def is_rejected(error):
+    ''' tells whether the API refused the upload itself, e.g. an unknown, expired or cancelled upload ID or part IDs
+    that do not belong to it, rather than failing transiently '''
+    from openai import APIStatusError
+    return isinstance(error, APIStatusError) and 400 <= error.status_code < 500 and error.status_code not in (408, 429)
+
+
+class UploadState:
+    ''' parts of an upload already accepted by the API, kept on disk so that a failed upload resumes where it stopped
+    when the action runs again '''
+
+    def __init__(self, fingerprint, state_dir=UPLOAD_STATE_DIR):
+        self.path = os.path.join(state_dir, '{0}.json'.format(fingerprint))
+        self._lock = threading.Lock()
+        self.upload_id = None
+        self.expires_at = 0
+        self.parts = {}
+
+    def load(self):
+        try:
+            with open(self.path) as state_file:
+                state = json.load(state_file)
+        except (OSError, ValueError):
+            return False
+        # an upload expires an hour after it is created, its parts cannot be completed afterwards
+        if state.get('expires_at', 0) - UPLOAD_EXPIRY_MARGIN <= time.time():
+            self.discard()
+            return False
+        self.upload_id, self.expires_at = state['upload_id'], state['expires_at']
+        self.parts = {int(index): part_id for index, part_id in state.get('parts', {}).items()}
+        return True
+
+    def save(self):
+        # the state holds upload ids of the account, only the owner of the directory can list or read it
+        state_dir = os.path.dirname(self.path)
+        os.makedirs(state_dir, mode=0o700, exist_ok=True)
+        try:
+            os.chmod(state_dir, 0o700)
+        except OSError:
+            pass
+        temporary_path = '{0}.{1}'.format(self.path, threading.get_ident())
+        fd = os.open(temporary_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.fchmod(fd, 0o600)
+        except OSError:
+            pass
+        with os.fdopen(fd, 'w') as state_file:
+            json.dump({'upload_id': self.upload_id, 'expires_at': self.expires_at, 'parts': self.parts}, state_file)
+        os.replace(temporary_path, self.path)
+
+    def start(self, upload):
+        self.upload_id, self.expires_at, self.parts = upload.id, upload.expires_at, {}
+        self.save()
+
+    def add_part(self, index, part_id):
+        with self._lock:
+            self.parts[index] = part_id
+            self.save()
+
+    def discard(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def upload_file_in_parts(config, filename, file, purpose, part_size=UPLOAD_PART_SIZE,
+                         concurrency=UPLOAD_PART_CONCURRENCY):
+    ''' uploads a large file with the Uploads API, its parts sent concurrently; returns the created file object '''
+    client = get_client(config)
+    fd = file.fileno()
+    size = os.fstat(fd).st_size
+    state = UploadState(get_file_fingerprint(fd, filename, size, purpose))
+    resumed = state.load()
+    if resumed:
+        logger.info('Resuming upload {0} of {1}, {2} parts already uploaded'.format(state.upload_id, filename,
+                                                                                     len(state.parts)))
+    else:
+        from openai import NotFoundError
+        try:
+            upload = client.uploads.create(bytes=size, filename=filename, mime_type=get_mime_type(filename),
+                                           purpose=purpose)
+        except NotFoundError:
+            # endpoints without the Uploads API, e.g. older Azure OpenAI API versions, take the file in one request
+            logger.warning('Uploads API not available, uploading {0} in a single request'.format(filename))
+            return client.files.create(file=(filename, file), purpose=purpose)
+        state.start(upload)
+    offsets = list(range(0, size, part_size)) or [0]
+    start = time.perf_counter()
+
+    def upload_part(index):
+        part = FilePart(fd, offsets[index], min(part_size, size - offsets[index]))
+        response = client.uploads.parts.create(upload_id=state.upload_id, data=(filename, part))
+        state.add_part(index, response.id)
+
+    def send_and_complete():
+        pending = [index for index in range(len(offsets)) if index not in state.parts]
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(pending))),
+                                thread_name_prefix='openai-upload-part') as executor:
+            # the state keeps the parts uploaded before a failure, the next run only sends the others
+            for future in [executor.submit(in_current_context(upload_part), index) for index in pending]:
+                future.result()
+        return client.uploads.complete(upload_id=state.upload_id,
+                                       part_ids=[state.parts[index] for index in range(len(offsets))])
+
+    try:
+        upload = send_and_complete()
+    except Exception as error:
+        if not is_rejected(error):
+            raise
+        # a rejected upload cannot be resumed, the next run must not pick it up again
+        state.discard()
+        if not resumed:
+            raise
+        logger.warning('Upload {0} of {1} was rejected, restarting it: {2}'.format(state.upload_id, filename, error))
+        state.start(client.uploads.create(bytes=size, filename=filename, mime_type=get_mime_type(filename),
+                                          purpose=purpose))
+        try:
+            upload = send_and_complete()
+        except Exception as error:
+            if is_rejected(error):
+                state.discard()
+            raise
+    state.discard()
+    if upload.status != 'completed' or not upload.file:
+        raise ConnectorError('Upload {0} of {1} ended with status {2}'.format(upload.id, filename, upload.status))
+    elapsed = time.perf_counter() - start
+    logger.info('Uploaded {0} ({1} bytes, {2} parts) in {3:.3f}s'.format(filename, size, len(offsets), elapsed))
+    return upload.file
@@ -36,3 +36,13 @@ def execute_connector_action(config_id, connector_name, operation, payload, vers
         raise Exception(message)
     except Exception as error:
         raise Exception(f'Error occurred in executing connector action: {error}')
+
+
+def close_thread_db_connections():
+    ''' closes the database connections the connector action opened on a worker thread, django keeps one connection
+    per thread and does not close those of threads it did not start '''
+    try:
+        from django.db import connections
+        connections.close_all()
+    except Exception as error:
+        logger.debug(f'Unable to close the database connections of the thread: {error}')
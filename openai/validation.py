@@ -0,0 +1,131 @@
+"""
+Copyright start
+MIT License
+Copyright (c) 2025 Fortinet Inc
+Copyright end
+"""
+import threading
+
+JSON_TYPES = {
+    'string': lambda value: isinstance(value, str),
+    'object': lambda value: isinstance(value, dict),
+    'array': lambda value: isinstance(value, list),
+    'integer': lambda value: isinstance(value, int) and not isinstance(value, bool),
+    'number': lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    'boolean': lambda value: isinstance(value, bool),
+    'null': lambda value: value is None
+}
+# keywords the schema compiler checks natively, other schemas are validated with jsonschema
+SUPPORTED_KEYWORDS = {'type', 'items', 'properties', 'required'}
+
+
+def _format_path(path):
+    return ''.join('[{0}]'.format(key) if isinstance(key, int) else '.{0}'.format(key) for key in path)
+
+
+def _is_supported(schema):
+    if not isinstance(schema, dict) or not set(schema) <= SUPPORTED_KEYWORDS:
+        return False
+    types = schema.get('type', [])
+    if any(json_type not in JSON_TYPES for json_type in (types if isinstance(types, list) else [types])):
+        return False
+    if 'items' in schema and not _is_supported(schema['items']):
+        return False
+    return all(_is_supported(subschema) for subschema in schema.get('properties', {}).values())
+
+
+def _compile(schema):
+    ''' turns the schema into a function returning the (path, message) of the first error of an instance; the path
+    is only built on error, so valid instances are checked without allocations '''
+    checks = []
+    if 'type' in schema:
+        types = schema['type'] if isinstance(schema['type'], list) else [schema['type']]
+        type_checks = [JSON_TYPES[json_type] for json_type in types]
+        expected = ', '.join(repr(json_type) for json_type in types)
+
+        def check_type(instance):
+            for type_check in type_checks:
+                if type_check(instance):
+                    return None
+            return [], '{0!r} is not of type {1}'.format(instance, expected)
+        checks.append(check_type)
+    if 'required' in schema:
+        required = schema['required']
+
+        def check_required(instance):
+            if isinstance(instance, dict):
+                for name in required:
+                    if name not in instance:
+                        return [], '{0!r} is a required property'.format(name)
+        checks.append(check_required)
+    if 'properties' in schema:
+        properties = [(name, _compile(subschema)) for name, subschema in schema['properties'].items()]
+
+        def check_properties(instance):
+            if isinstance(instance, dict):
+                for name, check_property in properties:
+                    if name in instance:
+                        error = check_property(instance[name])
+                        if error:
+                            return [name] + error[0], error[1]
+        checks.append(check_properties)
+    if 'items' in schema:
+        check_item = _compile(schema['items'])
+
+        def check_items(instance):
+            if isinstance(instance, list):
+                for index, item in enumerate(instance):
+                    error = check_item(item)
+                    if error:
+                        return [index] + error[0], error[1]
+        checks.append(check_items)
+
+    def check(instance):
+        for schema_check in checks:
+            error = schema_check(instance)
+            if error:
+                return error
+    return check
+
+
+def _compile_jsonschema(schema):
+    from jsonschema.exceptions import best_match
+    from jsonschema.validators import validator_for
+    validator_class = validator_for(schema)
+    validator_class.check_schema(schema)
+    validator = validator_class(schema)
+
+    def check(instance):
+        error = best_match(validator.iter_errors(instance))
+        if error:
+            return list(error.absolute_path), error.message
+    return check
+
+
+class SchemaValidator:
+    ''' validator compiled once per schema; errors name the offending element, e.g. messages[3].content '''
+
+    def __init__(self, schema, name='instance'):
+        self.name = name
+        self.check = _compile(schema) if _is_supported(schema) else _compile_jsonschema(schema)
+
+    def first_error(self, instance):
+        error = self.check(instance)
+        if error:
+            path, message = error
+            return '{0}{1}: {2}'.format(self.name, _format_path(path), message)
+
+
+_validators = {}
+_validators_lock = threading.Lock()
+
+
+def get_validator(schema, name='instance'):
+    key = (id(schema), name)
+    validator = _validators.get(key)
+    if validator is None:
+        with _validators_lock:
+            validator = _validators.get(key)
+            if validator is None:
+                validator = _validators[key] = SchemaValidator(schema, name)
+    return validator
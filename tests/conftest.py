@@ -0,0 +1,67 @@
+"""
+Copyright start
+MIT License
+Copyright (c) 2025 Fortinet Inc
+Copyright end
+"""
+import os
+import sys
+import types
+import logging
+
+CONNECTOR_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'openai')
+
+
+def _stub_module(name, **attributes):
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    sys.modules[name] = module
+    if '.' in name:
+        parent, child = name.rsplit('.', 1)
+        setattr(sys.modules[parent], child, module)
+    return module
+
+
+def _stub_platform_modules():
+    ''' the connector runs inside FortiSOAR, outside of it the few platform helpers it imports are stubbed '''
+    try:
+        import connectors.core.connector
+        return
+    except ImportError:
+        pass
+
+    class ConnectorError(Exception):
+        pass
+
+    class Connector:
+        pass
+
+    def save_file_in_env(env, file_path):
+        pass
+
+    def download_file_from_cyops(file_iri):
+        raise ConnectorError('FortiSOAR files are not available in tests')
+
+    def make_request(*args, **kwargs):
+        raise ConnectorError('FortiSOAR API is not available in tests')
+
+    _stub_module('connectors', __path__=[])
+    _stub_module('connectors.core', __path__=[])
+    _stub_module('connectors.core.connector', get_logger=logging.getLogger, ConnectorError=ConnectorError,
+                 Connector=Connector)
+    _stub_module('connectors.cyops_utilities', __path__=[])
+    _stub_module('connectors.cyops_utilities.files', save_file_in_env=save_file_in_env,
+                 download_file_from_cyops=download_file_from_cyops)
+    _stub_module('integrations', __path__=[])
+    _stub_module('integrations.crudhub', make_request=make_request)
+
+
+def _load_connector():
+    ''' the connector directory is named like the OpenAI SDK it imports, it is loaded as the openai_connector
+    package so that both can be imported '''
+    if 'openai_connector' not in sys.modules:
+        _stub_module('openai_connector', __path__=[CONNECTOR_DIR], __file__=os.path.join(CONNECTOR_DIR, '__init__.py'))
+
+
+_stub_platform_modules()
+_load_connector()
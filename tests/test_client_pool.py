@@ -0,0 +1,121 @@
+"""
+Copyright start
+MIT License
+Copyright (c) 2025 Fortinet Inc
+Copyright end
+"""
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+pytest.importorskip('openai')
+pytest.importorskip('httpx')
+
+from openai_connector import client_pool as client_pool_module
+from openai_connector.operations import list_models
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    ''' answers the list models request with the API key and version it was sent with '''
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        body = json.dumps({'object': 'list', 'data': [{
+            'id': self.headers.get('api-key'), 'object': 'model', 'created': 0,
+            'owned_by': query.get('api-version', [''])[0]}]}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), EchoHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:{0}'.format(server.server_port)
+    server.shutdown()
+    server.server_close()
+
+
+def get_configs(base_url, count):
+    # the configurations share their API versions, only the API key tells some of them apart
+    return [{'apiKey': 'key-{0}'.format(index), 'api_type': True, 'api_base': base_url,
+             'api_version': 'version-{0}'.format(index % 2), 'verify_ssl': False, 'max_retries': 0}
+            for index in range(count)]
+
+
+def run_concurrently(configs, requests, workers):
+    def run(index):
+        config = configs[index % len(configs)]
+        model = list_models(config, {})['data'][0]
+        return model['id'] == config['apiKey'] and model['owned_by'] == config['api_version']
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(run, range(requests)))
+
+
+@pytest.mark.parametrize('max_size', [16, 2])
+def test_concurrent_requests_use_their_own_config(server, monkeypatch, max_size):
+    # with fewer pooled clients than configurations, clients are evicted while other threads still use them
+    monkeypatch.setattr(client_pool_module, 'client_pool', client_pool_module.ClientPool(max_size=max_size))
+    results = run_concurrently(get_configs(server, 6), requests=600, workers=32)
+    assert len(results) == 600
+    assert all(results)
+    stats = client_pool_module.client_pool.stats()
+    assert stats['size'] <= max_size
+    if max_size >= 6:
+        assert stats['misses'] == 6
+
+
+def test_clients_are_built_outside_the_pool_lock(monkeypatch):
+    # a slow client build only holds back the callers of its own configuration
+    slow_build_started = threading.Event()
+    release_slow_build = threading.Event()
+    builds = []
+
+    def build_client(config, key, is_async=False):
+        builds.append(config['apiKey'])
+        if config['apiKey'] == 'slow':
+            slow_build_started.set()
+            assert release_slow_build.wait(5)
+        return object()
+
+    monkeypatch.setattr(client_pool_module, 'build_client', build_client)
+    monkeypatch.setattr(client_pool_module, 'refresh_client_policies', lambda config, key: None)
+    pool = client_pool_module.ClientPool()
+    slow = {'apiKey': 'slow'}
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        slow_clients = [executor.submit(pool.get, slow) for _ in range(3)]
+        assert slow_build_started.wait(5)
+        fast_client = executor.submit(pool.get, {'apiKey': 'fast'}).result(timeout=5)
+        release_slow_build.set()
+        clients = {future.result(timeout=5) for future in slow_clients}
+    assert fast_client is not None
+    assert len(clients) == 1
+    assert sorted(builds) == ['fast', 'slow']
+    assert pool.stats()['misses'] == 2
+
+
+def test_rate_limiters_are_shared_by_account_and_deployment(monkeypatch):
+    monkeypatch.setattr(client_pool_module, 'rate_limiters', {})
+    config = {'apiKey': 'key', 'api_type': True, 'api_base': 'example.openai.azure.com', 'deployment_id': 'gpt-4o',
+              'api_version': '2024-10-21', 'verify_ssl': True}
+    rate_limiter = client_pool_module.get_rate_limiter(config)
+    # the API version, the SSL verification and the proxy are transport settings of the same quota
+    monkeypatch.setenv('HTTPS_PROXY', 'http://proxy.example.com:3128')
+    assert client_pool_module.get_rate_limiter(dict(config, api_version='2025-01-01', verify_ssl=False)) \
+        is rate_limiter
+    assert client_pool_module.get_rate_limiter(dict(config, deployment_id='gpt-4o-mini')) is not rate_limiter
+    assert client_pool_module.get_rate_limiter(dict(config, apiKey='other-key')) is not rate_limiter
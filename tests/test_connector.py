@@ -0,0 +1,27 @@
+"""
+Copyright start
+MIT License
+Copyright (c) 2025 Fortinet Inc
+Copyright end
+"""
+import os
+import sys
+import json
+import subprocess
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+LAZY_MODULES = ['openai', 'httpx', 'tiktoken']
+
+IMPORT_CONNECTOR = '''
+import sys, json
+import conftest
+import openai_connector.connector
+print(json.dumps(sorted(name for name in {0} if name in sys.modules)))
+'''.format(LAZY_MODULES)
+
+
+def test_connector_import_does_not_load_heavy_dependencies():
+    # a fresh interpreter, the other tests load these modules
+    output = subprocess.run([sys.executable, '-c', IMPORT_CONNECTOR], cwd=TESTS_DIR, check=True,
+                            stdout=subprocess.PIPE).stdout
+    assert json.loads(output.decode('utf-8').splitlines()[-1]) == []
@@ -0,0 +1,50 @@
+"""
+Copyright start
+MIT License
+Copyright (c) 2025 Fortinet Inc
+Copyright end
+"""
+import json
+
+import pytest
+
+from openai_connector import operations
+
+
+class WordEncoding:
+    ''' stand-in for a tiktoken encoding, one token per word '''
+
+    def encode_ordinary(self, text):
+        return text.split()
+
+
+@pytest.fixture(autouse=True)
+def encoding(monkeypatch):
+    monkeypatch.setattr(operations, 'get_encoding', lambda model, config: WordEncoding())
+
+
+def test_count_tokens_of_a_tool_call_conversation():
+    messages = [
+        {'role': 'user', 'content': [{'type': 'text', 'text': 'weather in paris'},
+                                     {'type': 'image_url', 'image_url': {'url': 'https://example.com/a.png'}}]},
+        {'role': 'assistant', 'content': None, 'tool_calls': [
+            {'id': 'call_1', 'type': 'function', 'function': {'name': 'get_weather', 'arguments': '{"city": "paris"}'}}]},
+        {'role': 'tool', 'tool_call_id': 'call_1', 'content': 'sunny'}
+    ]
+    result = operations.count_tokens({}, {'model': 'gpt-4', 'input_type': 'Chat Messages',
+                                          'messages': json.dumps(messages)})
+    # 3 tokens per message, then the role and the texts of the message; 3 tokens prime the reply
+    assert result['items'] == [3 + 1 + 3, 3 + 1 + 1 + 2, 3 + 1 + 1]
+    assert result['tokens'] == sum(result['items']) + 3
+
+
+def test_count_tokens_rejects_a_message_without_role():
+    with pytest.raises(Exception, match='role'):
+        operations.count_tokens({}, {'model': 'gpt-4', 'input_type': 'Chat Messages',
+                                     'messages': [{'content': 'hello'}]})
+
+
+def test_count_tokens_counts_text_like_a_list_of_texts():
+    text = 'hello <|endoftext|> world'
+    assert operations.count_tokens({}, {'model': 'gpt-4', 'input_text': text})['tokens'] == \
+        operations.count_tokens({}, {'model': 'gpt-4', 'input_type': 'List of Texts', 'input_texts': [text]})['tokens']
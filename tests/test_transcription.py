@@ -0,0 +1,183 @@
+"""
+Copyright start
+MIT License
+Copyright (c) 2025 Fortinet Inc
+Copyright end
+"""
+import io
+import json
+import wave
+import struct
+import threading
+from email.parser import BytesParser
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from connectors.core.connector import ConnectorError
+from openai_connector import transcription
+from openai_connector.transcription import plan_audio_segments, stitch_transcriptions
+
+FRAME_RATE = 16000
+# every sample of a 0.5 s block of the test audio holds the number of the word spoken in it
+WORD_FRAMES = FRAME_RATE // 2
+
+
+def words_of(result):
+    return [word['word'] for word in result['words']]
+
+
+def test_plan_audio_segments_overlap_and_cover_the_audio():
+    bounds = plan_audio_segments(frames=100 * FRAME_RATE, frame_rate=FRAME_RATE, frame_size=2, segment_duration=30,
+                                 overlap=2)
+    assert bounds[0] == (0, 30 * FRAME_RATE)
+    assert bounds[-1][1] == 100 * FRAME_RATE
+    for (start, end), (next_start, next_end) in zip(bounds, bounds[1:]):
+        assert end - next_start == 2 * FRAME_RATE
+        assert next_end - next_start <= 30 * FRAME_RATE
+
+
+def test_plan_audio_segments_short_audio_is_one_segment():
+    assert plan_audio_segments(frames=FRAME_RATE, frame_rate=FRAME_RATE, frame_size=2, segment_duration=30,
+                               overlap=2) == [(0, FRAME_RATE)]
+
+
+def test_plan_audio_segments_stay_within_the_upload_limit(monkeypatch):
+    monkeypatch.setattr(transcription, 'TRANSCRIPTION_MAX_FILE_SIZE', 44 + 10 * FRAME_RATE * 2)
+    bounds = plan_audio_segments(frames=100 * FRAME_RATE, frame_rate=FRAME_RATE, frame_size=2, segment_duration=600,
+                                 overlap=2)
+    assert len(bounds) > 1
+    assert all((end - start) * 2 + 44 <= transcription.TRANSCRIPTION_MAX_FILE_SIZE for start, end in bounds)
+
+
+def test_plan_audio_segments_overlap_is_at_most_half_a_segment():
+    bounds = plan_audio_segments(frames=10 * FRAME_RATE, frame_rate=FRAME_RATE, frame_size=2, segment_duration=2,
+                                 overlap=1.5)
+    assert all(end - next_start == FRAME_RATE for (start, end), (next_start, next_end) in zip(bounds, bounds[1:]))
+
+
+@pytest.mark.parametrize('segment_duration, overlap', [(-30, 2), (0, 0), (30, -1), (30, 30), (30, 45)])
+def test_plan_audio_segments_rejects_invalid_settings(segment_duration, overlap):
+    with pytest.raises(ConnectorError):
+        plan_audio_segments(frames=100 * FRAME_RATE, frame_rate=FRAME_RATE, frame_size=2,
+                            segment_duration=segment_duration, overlap=overlap)
+
+
+def test_plan_audio_segments_rejects_a_duration_under_one_frame():
+    with pytest.raises(ConnectorError):
+        plan_audio_segments(frames=100 * FRAME_RATE, frame_rate=FRAME_RATE, frame_size=2,
+                            segment_duration=0.5 / FRAME_RATE, overlap=0)
+
+
+def test_stitch_transcriptions_moves_timestamps_and_drops_the_overlap():
+    # two segments of 0-6 s and 4-10 s, both hear the words at 4 and 5 s
+    results = [
+        {'text': 'a b c d e f', 'task': 'transcribe', 'language': 'english', 'duration': 6.0,
+         'words': [{'word': word, 'start': float(index), 'end': index + 0.5} for index, word in enumerate('abcdef')],
+         'segments': [{'id': 0, 'seek': 0, 'start': 0.0, 'end': 3.5, 'text': ' a b c d'},
+                      {'id': 1, 'seek': 0, 'start': 4.0, 'end': 5.5, 'text': ' e f'}]},
+        {'text': 'e f g h i j', 'task': 'transcribe', 'language': 'english', 'duration': 6.0,
+         'words': [{'word': word, 'start': float(index), 'end': index + 0.5} for index, word in enumerate('efghij')],
+         'segments': [{'id': 0, 'seek': 0, 'start': 0.0, 'end': 2.5, 'text': ' e f g'},
+                      {'id': 1, 'seek': 0, 'start': 3.0, 'end': 5.5, 'text': ' h i j'}]}
+    ]
+    stitched = stitch_transcriptions(results, [(0.0, 6.0), (4.0, 10.0)], 10.0)
+    assert words_of(stitched) == list('abcdefghij')
+    assert [word['start'] for word in stitched['words']] == [float(index) for index in range(10)]
+    assert stitched['text'].split() == list('abcdefghij')
+    assert ' '.join(segment['text'] for segment in stitched['segments']).split() == list('abcdefghij')
+    assert [segment['id'] for segment in stitched['segments']] == list(range(len(stitched['segments'])))
+    assert stitched['segments'][-1]['end'] == 9.5
+    assert stitched['duration'] == 10.0
+
+
+def test_stitch_transcriptions_joins_plain_texts():
+    results = [{'text': 'one two three four'}, {'text': 'Three, four five six'}, {'text': 'six seven'}]
+    stitched = stitch_transcriptions(results, [(0.0, 6.0), (4.0, 10.0), (8.0, 12.0)], 12.0)
+    assert stitched == {'text': 'one two three four five six seven'}
+
+
+class TranscriptionHandler(BaseHTTPRequestHandler):
+    ''' stand-in for the transcription endpoint, it hears the word numbers written in the audio blocks '''
+    protocol_version = 'HTTP/1.1'
+    requests = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        message = BytesParser().parsebytes(
+            b'Content-Type: ' + self.headers['Content-Type'].encode('utf-8') + b'\r\n\r\n' + body)
+        fields, granularities = {}, []
+        for part in message.get_payload():
+            name = part.get_param('name', header='content-disposition')
+            if name.startswith('timestamp_granularities'):
+                granularities.append(part.get_payload(decode=True).decode('utf-8'))
+            else:
+                fields[name] = part.get_payload(decode=True)
+        self.requests.append(len(fields['file']))
+        with wave.open(io.BytesIO(fields['file'])) as audio:
+            frames = audio.readframes(audio.getnframes())
+        samples = struct.unpack('<{0}h'.format(len(frames) // 2), frames)
+        words = [{'word': 'w{0}'.format(samples[index]), 'start': index / FRAME_RATE,
+                  'end': index / FRAME_RATE + 0.4}
+                 for index in range(0, len(samples) - WORD_FRAMES + 1, WORD_FRAMES) if samples[index]]
+        response = {'task': 'transcribe', 'language': 'english', 'duration': len(samples) / FRAME_RATE,
+                    'text': ' '.join(word['word'] for word in words)}
+        if 'word' in granularities:
+            response['words'] = words
+        if 'segment' in granularities:
+            response['segments'] = [{
+                'id': index, 'seek': 0, 'start': group[0]['start'], 'end': group[-1]['end'],
+                'text': ' ' + ' '.join(word['word'] for word in group), 'tokens': [], 'temperature': 0.0,
+                'avg_logprob': -0.1, 'compression_ratio': 1.0, 'no_speech_prob': 0.0}
+                for index, group in enumerate(words[start:start + 10] for start in range(0, len(words), 10))]
+        body = json.dumps(response).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    pytest.importorskip('openai')
+    pytest.importorskip('httpx')
+    TranscriptionHandler.requests = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), TranscriptionHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:{0}'.format(server.server_port)
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def audio_path(tmp_path):
+    path = tmp_path / 'long.wav'
+    with wave.open(str(path), 'wb') as audio:
+        audio.setnchannels(1)
+        audio.setsampwidth(2)
+        audio.setframerate(FRAME_RATE)
+        for word in range(1, 241):
+            audio.writeframes(struct.pack('<h', word) * WORD_FRAMES)
+    return str(path)
+
+
+def test_segmented_transcription_matches_the_audio(server, audio_path):
+    from openai_connector.operations import create_transcription
+    config = {'apiKey': 'key', 'api_type': True, 'api_base': server, 'api_version': 'version', 'verify_ssl': False}
+    params = {'model': 'whisper-1', 'file': audio_path, 'timestamp_granularities': ['word', 'segment'],
+              'segmented': True, 'segment_duration': 20, 'segment_overlap': 2}
+    result = create_transcription(config, params)
+    expected = ['w{0}'.format(word) for word in range(1, 241)]
+    assert result['audio_segments']['count'] == len(TranscriptionHandler.requests) == 7
+    assert max(TranscriptionHandler.requests) == 44 + 20 * FRAME_RATE * 2
+    assert words_of(result) == expected
+    assert all(word['start'] == index * 0.5 for index, word in enumerate(result['words']))
+    assert result['text'].split() == expected
+    assert ' '.join(segment['text'] for segment in result['segments']).split() == expected
+    assert result['duration'] == 120.0